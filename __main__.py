@@ -1,7 +1,134 @@
 # -*- coding: utf-8 -*-
+import functools
 import sys
+import benchmark
+import databases
 import doc
+import filters
+import htmldoc
+import profiling
+import snapshot
 import sync
+import templating
+import watch
+
+
+def __pop_option(name, default=None):
+
+    """ Remove de sys.argv a opção 'name' e o seu valor,
+        retornando o valor ou 'default' caso ela não tenha sido passada.
+        Ex: __pop_option('--jobs', 1) para 'doc_all path --jobs 4'
+    """
+
+    if name not in sys.argv:
+        return default
+
+    i = sys.argv.index(name)
+    if i + 1 >= len(sys.argv):
+        print "Valor não especificado para a opção '%s'." % (name,)
+        sys.exit(1)
+
+    value = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+
+    return value
+
+
+def __pop_flag(name):
+
+    """ Remove de sys.argv a opção 'name', retornando True
+        caso ela tenha sido passada.
+    """
+
+    if name not in sys.argv:
+        return False
+
+    sys.argv.remove(name)
+    return True
+
+
+def __pop_options(name):
+
+    """ Remove de sys.argv todas as ocorrências da opção 'name' e os seus
+        valores, retornando a lista de valores.
+        Ex: __pop_options('--exclude') para '--exclude a --exclude b'
+    """
+
+    values = []
+    value = __pop_option(name)
+    while value is not None:
+        values.append(value)
+        value = __pop_option(name)
+
+    return values
+
+
+def __filter():
+
+    """ Filtro dos schemas e relações (tabelas e views) indicado pelas
+        opções --schema, --exclude-schema, --relation e
+        --exclude-relation, que podem ser repetidas. Os padrões são
+        globs ('tenant_*', 'log_20[0-9][0-9]', '[!_]*') ou, com o
+        prefixo 're:', expressões regulares.
+        None caso nenhuma tenha sido passada.
+    """
+
+    patterns = [[p.decode('utf-8') for p in __pop_options(name)]
+                for name in ('--schema', '--exclude-schema', '--relation',
+                             '--exclude-relation')]
+
+    if not any(patterns):
+        return None
+
+    try:
+        return filters.Filter(*patterns)
+    except ValueError, e:
+        print unicode(e).encode('utf-8')
+        sys.exit(1)
+
+
+def __jobs(default=1):
+
+    """ Número de processos indicado pela opção --jobs """
+
+    try:
+        jobs = __pop_option('--jobs')
+        return default if jobs is None else int(jobs)
+    except ValueError:
+        print "A opção '--jobs' deve ser um número inteiro."
+        sys.exit(1)
+
+
+def __databases(func, variant='text'):
+
+    """ Com a opção --databases, gera os arquivos de todos os bancos de
+        dados de local_settings (ver databases.configured), cada um em
+        uma pasta dentro de 'path'. 'variant' é a variante dos templates
+        usados por 'func' (ver databases.generate). Retorna False caso
+        a opção não tenha sido passada.
+    """
+
+    if not __pop_flag('--databases'):
+        return False
+
+    try:
+        per_host = int(__pop_option('--per-host', databases.PER_HOST))
+    except ValueError:
+        print "A opção '--per-host' deve ser um número inteiro."
+        sys.exit(1)
+
+    jobs = __jobs(None)
+    force = __pop_flag('--force')
+
+    if len(sys.argv) < 3:
+        print "Caminho não especificado."
+        sys.exit(1)
+
+    if databases.generate(func, sys.argv[2], databases.configured(), jobs,
+                          per_host, force, variant):
+        sys.exit(1)
+
+    return True
 
 
 def __not_found():
@@ -11,93 +138,306 @@ def __not_found():
 def __doc_all():
 
     """ Gera a documentação de todos os schemas
-        Utilização: doc_all path
+        alterados desde a última execução.
+        Com --databases, documenta todos os bancos de dados de
+        local_settings, --jobs N ao mesmo tempo (padrão: --per-host N
+        por servidor). Com --split, gera uma
+        pasta por schema, com um arquivo por tabela ou view.
+        Ver __filter para os filtros de schemas e relações.
+        Utilização: doc_all path [--jobs N] [--force] [--split]
+                            [--from-snapshot arquivo]
+                            [--databases [--per-host N]]
+                            [--schema padrão] [--exclude-schema padrão]
+                            [--relation padrão] [--exclude-relation padrão]
     """
 
+    split = __pop_flag('--split')
+    filter = __filter()
+
+    if __databases(functools.partial(doc.doc_all, split=split,
+                                     filter=filter)):
+        return
+
+    jobs = __jobs()
+    force = __pop_flag('--force')
+    snapshot_file = __pop_option('--from-snapshot')
+
     if len(sys.argv) < 3:
         print "Caminho não especificado. Utilize 'doc_all path'"
         return
 
-    doc.doc_all(sys.argv[2])
+    doc.doc_all(sys.argv[2], jobs, force, snapshot_file, split,
+                filter=filter)
 
 
 def __doc_schema():
     """ Gera a documentação de um schema específico
-        Utilização: doc_schema path schema
+        Utilização: doc_schema path schema [--from-snapshot arquivo]
+                               [--relation padrão]
+                               [--exclude-relation padrão]
     """
 
+    snapshot_file = __pop_option('--from-snapshot')
+    filter = __filter()
+
     if len(sys.argv) < 4:
         print "Argumentos inválidos. Utilize 'doc_schema path schema'"
         return
 
-    doc.doc_schema(sys.argv[2], sys.argv[3])
+    doc.doc_schema(sys.argv[2], sys.argv[3], snapshot_file, filter)
+
+
+def __html_all():
+
+    """ Gera um site estático com a documentação de todos os schemas,
+        uma página por schema e por tabela e um índice de busca.
+        Somente os schemas alterados desde a última execução são
+        gerados novamente.
+        Ver __filter para os filtros de schemas e relações.
+        Utilização: html_all path [--jobs N] [--force]
+                             [--from-snapshot arquivo]
+                             [--databases [--per-host N]]
+                             [--schema padrão] [--exclude-schema padrão]
+                             [--relation padrão] [--exclude-relation padrão]
+    """
+
+    filter = __filter()
+
+    if __databases(functools.partial(htmldoc.html_all, filter=filter),
+                   'html'):
+        return
+
+    jobs = __jobs()
+    force = __pop_flag('--force')
+    snapshot_file = __pop_option('--from-snapshot')
+
+    if len(sys.argv) < 3:
+        print "Caminho não especificado. Utilize 'html_all path'"
+        return
+
+    htmldoc.html_all(sys.argv[2], jobs, force, snapshot_file, filter)
 
 
 def __all_yamls():
 
-    """ Gera todos yamls de todos os schemas
-        Utilização: doc_all path
+    """ Gera os yamls de todos os schemas
+        alterados desde a última execução.
+        Com --databases, gera os de todos os bancos de dados de
+        local_settings, --jobs N ao mesmo tempo (padrão: --per-host N
+        por servidor).
+        Ver __filter para os filtros de schemas e relações.
+        Utilização: all_yamls path [--jobs N] [--force]
+                              [--from-snapshot arquivo]
+                              [--databases [--per-host N]]
+                              [--schema padrão] [--exclude-schema padrão]
+                              [--relation padrão] [--exclude-relation padrão]
     """
 
+    filter = __filter()
+
+    if __databases(functools.partial(sync.all_yamls, filter=filter),
+                   None):
+        return
+
+    jobs = __jobs()
+    force = __pop_flag('--force')
+    snapshot_file = __pop_option('--from-snapshot')
+
     if len(sys.argv) < 3:
         print "Caminho não especificado. Utilize 'all_yaml path'"
         return
 
-    sync.all_yamls(sys.argv[2])
+    sync.all_yamls(sys.argv[2], jobs, force, snapshot_file, filter)
 
 
 def __schema_yaml():
     """ Gera o yaml de um schema específico
-        Utilização: doc_schema path schema
+        Utilização: schema_yaml path schema [--from-snapshot arquivo]
+                                [--relation padrão]
+                                [--exclude-relation padrão]
     """
 
+    snapshot_file = __pop_option('--from-snapshot')
+    filter = __filter()
+
     if len(sys.argv) < 4:
         print "Argumentos inválidos. Utilize 'schema_yaml path schema'"
         return
 
-    sync.schema_yaml(sys.argv[2], sys.argv[3])
+    sync.schema_yaml(sys.argv[2], sys.argv[3], snapshot_file, filter)
 
 
 def __sync_schema():
     """ Sincroniza as descrições do banco de dados
         com as do yaml que descreve o schema.
-        Utilização: sync_schema path schema
+        Utilização: sync_schema path schema [--lock-timeout tempo]
+                                [--statement-timeout tempo]
     """
 
+    lock_timeout = __pop_option('--lock-timeout')
+    statement_timeout = __pop_option('--statement-timeout')
+
     if len(sys.argv) < 4:
         print "Argumentos inválidos. Utilize 'sync_schema path schema'"
         return
 
-    sync.sync_schema(sys.argv[2], sys.argv[3])
+    sync.sync_schema(sys.argv[2], sys.argv[3], lock_timeout,
+                     statement_timeout)
 
 
 def __sync_all():
 
     """ Sincroniza as descrições do banco de dados de todos
         schemas cujos yamls se encontram na pasta passada
-        como argumento.
+        como argumento. Os comandos esperam por bloqueios no máximo
+        --lock-timeout (padrão: 2s) e duram no máximo
+        --statement-timeout (padrão: 30s), com valores no formato
+        do PostgreSQL (ex: 500ms, 2s).
+        Utilização: sync_all path [--jobs N] [--lock-timeout tempo]
+                             [--statement-timeout tempo]
     """
 
+    jobs = __jobs()
+    lock_timeout = __pop_option('--lock-timeout')
+    statement_timeout = __pop_option('--statement-timeout')
+
     if len(sys.argv) < 3:
         print "Caminho não especificado. Utilize 'sync_all path'"
         return
 
-    sync.sync_all(sys.argv[2])
+    if sync.sync_all(sys.argv[2], jobs, lock_timeout, statement_timeout):
+        sys.exit(1)
+
+
+def __snapshot():
+
+    """ Salva todo o catálogo do banco de dados em um arquivo, para
+        gerar a documentação depois sem acessar o banco de dados
+        (opção --from-snapshot).
+        Utilização: snapshot arquivo
+    """
+
+    if len(sys.argv) < 3:
+        print "Arquivo não especificado. Utilize 'snapshot arquivo'"
+        return
+
+    snapshot.snapshot(sys.argv[2])
+
+
+def __compile_templates():
+
+    """ Pré-compila os templates em módulos Python, para que as
+        próximas execuções não precisem compilá-los.
+        Utilização: compile_templates
+    """
+
+    templating.compile_templates()
+
+
+def __bench():
+
+    """ Mede o desempenho de doc_all, all_yamls e sync_all sobre um
+        catálogo sintético, com uma conexão simulada ou, com --dsn,
+        um banco PostgreSQL exclusivo para o benchmark.
+        Os resultados são acrescentados ao arquivo de --output.
+        Utilização: bench [--schemas N] [--tables N] [--columns N]
+                          [--indexes N] [--constraints N] [--views N]
+                          [--latency segundos] [--jobs N] [--changes fração]
+                          [--scenarios doc_all,all_yamls,sync_all]
+                          [--dsn dsn] [--keep] [--output arquivo]
+    """
+
+    try:
+        synthetic = benchmark.SyntheticCatalog(
+            schemas=int(__pop_option('--schemas', 10)),
+            tables=int(__pop_option('--tables', 50)),
+            columns=int(__pop_option('--columns', 20)),
+            indexes=int(__pop_option('--indexes', 2)),
+            constraints=int(__pop_option('--constraints', 2)),
+            views=int(__pop_option('--views', 0)))
+        latency = float(__pop_option('--latency', 0))
+        changes = float(__pop_option('--changes', 0.01))
+    except ValueError:
+        print "Os tamanhos, a latência e a fração devem ser números."
+        return
+
+    scenarios = __pop_option('--scenarios', ",".join(benchmark.SCENARIOS))
+    scenarios = scenarios.split(",")
+    for name in scenarios:
+        if name not in benchmark.SCENARIOS:
+            print "Cenário '%s' não encontrado." % (name,)
+            return
+
+    benchmark.run(synthetic,
+                  dsn=__pop_option('--dsn'),
+                  latency=latency,
+                  jobs=__jobs(),
+                  changes=changes,
+                  scenarios=scenarios,
+                  output=__pop_option('--output', 'benchmark.jsonl'),
+                  keep=__pop_flag('--keep'))
+
+
+def __watch():
+
+    """ Mantém atualizada a documentação em markdown da pasta 'path',
+        gerando os schemas alterados poucos segundos após cada
+        alteração. Os avisos são enviados por event triggers, criados
+        com --install (exige superusuário) e removidos com --uninstall.
+        Utilização: watch path [--split] [--install]
+                          [--debounce segundos]
+                    watch --uninstall
+    """
+
+    if __pop_flag('--uninstall'):
+        watch.uninstall()
+        return
+
+    try:
+        debounce = float(__pop_option('--debounce', watch.DEBOUNCE))
+    except ValueError:
+        print "A opção '--debounce' deve ser um número."
+        return
+
+    split = __pop_flag('--split')
+    install = __pop_flag('--install')
+
+    if len(sys.argv) < 3:
+        print "Caminho não especificado. Utilize 'watch path'"
+        return
+
+    if install:
+        watch.install()
+
+    watch.watch(sys.argv[2], split, debounce)
 
 
 def __switch_command():
     return {
         "doc_all": __doc_all,
         "doc_schema": __doc_schema,
+        "html_all": __html_all,
         "schema_yaml": __schema_yaml,
         "all_yamls": __all_yamls,
         "sync_schema": __sync_schema,
-        "sync_all": __sync_all
+        "sync_all": __sync_all,
+        "snapshot": __snapshot,
+        "compile_templates": __compile_templates,
+        "bench": __bench,
+        "watch": __watch
     }.get(sys.argv[1], __not_found)
 
 
 if __name__ == "__main__":
+    # Opções válidas para todos os comandos:
+    # --profile: escreve o resumo dos comandos enviados ao banco de dados
+    # --profile-out arquivo: idem, salvando as estatísticas do cProfile
+    profile_out = __pop_option('--profile-out')
+    profile = __pop_flag('--profile') or profile_out is not None
+
     if len(sys.argv) < 2:
         print "Comando não especificado."
+    elif profile:
+        profiling.profile(__switch_command(), profile_out)
     else:
         __switch_command()()
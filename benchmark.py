@@ -0,0 +1,654 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import Queue
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import psycopg2
+import psycopg2.extensions
+import yaml
+
+import catalog
+import doc
+import sync
+from connection import Connection
+from snapshot import Snapshot
+
+# Tipos das colunas sintéticas:
+# (data_type, character_maximum_length, numeric_precision, tipo no DDL)
+COLUMN_TYPES = (
+    (u"integer", None, 32, "integer"),
+    (u"character varying", 80, None, "varchar(80)"),
+    (u"text", None, None, "text"),
+    (u"timestamp without time zone", None, None, "timestamp"),
+    (u"double precision", None, 53, "double precision"),
+    (u"numeric", None, 12, "numeric(12, 2)"),
+)
+
+SCENARIOS = ("doc_all", "all_yamls", "sync_all")
+
+
+class SyntheticCatalog(object):
+
+    """ Catálogo sintético com 'schemas' schemas, cada um com 'tables'
+        tabelas e 'views' views de 'columns' colunas. Cada tabela tem
+        'indexes' índices e 'constraints' constraints.
+
+        Pode ser servido por FakeConnection ou criado em um banco de
+        dados real com ddl().
+    """
+
+    def __init__(self, schemas=10, tables=50, columns=20, indexes=2,
+                 constraints=2, views=0):
+        self.schemas = schemas
+        self.tables = tables
+        self.columns = columns
+        self.indexes = indexes
+        self.constraints = constraints
+        self.views = views
+        self.__snapshot = None
+
+    def params(self):
+        return {
+            "schemas": self.schemas,
+            "tables": self.tables,
+            "columns": self.columns,
+            "indexes": self.indexes,
+            "constraints": self.constraints,
+            "views": self.views,
+        }
+
+    def relation_count(self):
+        return self.schemas * (self.tables + self.views)
+
+    def column_count(self):
+        return self.relation_count() * self.columns
+
+    def schema_names(self):
+        return [u"bench_%04d" % i for i in range(self.schemas)]
+
+    def relation_names(self):
+
+        """ Retorna a lista de (nome, relkind) das relações de um schema """
+
+        return ([(u"tabela_%04d" % i, 'r') for i in range(self.tables)] +
+                [(u"view_%04d" % i, 'v') for i in range(self.views)])
+
+    def column(self, k):
+
+        """ Retorna (nome, data_type, character_maximum_length,
+            numeric_precision, tipo no DDL) da k-ésima coluna
+        """
+
+        data_type, length, precision, ddl = (
+            COLUMN_TYPES[k % len(COLUMN_TYPES)])
+
+        return (u"coluna_%03d" % k, data_type, length, precision, ddl)
+
+    def description(self, *identity):
+        return u"Descrição de " + u".".join(identity)
+
+    def snapshot(self):
+
+        """ Retorna o catálogo no formato de um Snapshot """
+
+        if self.__snapshot is not None:
+            return self.__snapshot
+
+        data = {"version": Snapshot.VERSION, "created": time.time()}
+        for key, query in catalog.QUERIES:
+            data[key] = []
+
+        oid = 100000
+        for nspoid, schema in enumerate(self.schema_names(), 1):
+            data["schemas"].append([nspoid, schema,
+                                    self.description(schema)])
+            data["fingerprints"].append(
+                [schema, hashlib.md5(json.dumps(self.params())).hexdigest()])
+
+            for name, kind in self.relation_names():
+                oid += 1
+                data["relations"].append(
+                    [oid, nspoid, name, kind,
+                     self.description(schema, name)])
+
+                for k in range(self.columns):
+                    cname, data_type, length, precision, ddl = (
+                        self.column(k))
+                    data["attributes"].append(
+                        [oid, cname, self.description(schema, name, cname),
+                         None, k == 0 and u"NO" or u"YES", data_type,
+                         length, precision])
+
+                if kind == 'v':
+                    continue
+
+                for m in range(self.indexes):
+                    data["indexes"].append(
+                        [oid, u"%s_idx_%02d" % (name, m), u"btree",
+                         [self.column(m % self.columns)[0]]])
+
+                for m in range(self.constraints):
+                    data["constraints"].append(
+                        [oid, u"%s_chk_%02d" % (name, m),
+                         u"CHECK (%s IS NOT NULL)" %
+                         (self.column(m % self.columns)[0],)])
+
+        self.__snapshot = Snapshot(data)
+        return self.__snapshot
+
+    def descriptions(self, schema):
+
+        """ Linhas de catalog.DESCRIPTIONS_QUERY para o schema """
+
+        if schema not in self.schema_names():
+            return []
+
+        rows = [(u"SCHEMA", schema, None, None, self.description(schema))]
+
+        for name, kind in self.relation_names():
+            rows.append((kind == 'v' and u"VIEW" or u"TABLE", schema, name,
+                         None, self.description(schema, name)))
+
+            for k in range(self.columns):
+                cname = self.column(k)[0]
+                rows.append((u"COLUMN", schema, name, cname,
+                             self.description(schema, name, cname)))
+
+        return rows
+
+    def ddl(self):
+
+        """ Comandos que criam o catálogo em um banco de dados real,
+            um comando por relação.
+        """
+
+        for schema in self.schema_names():
+            yield (u'CREATE SCHEMA "{0}"; COMMENT ON SCHEMA "{0}" IS {1}'
+                   .format(schema, self.__literal(self.description(schema))))
+
+            for name, kind in self.relation_names():
+                target = u'"{0}"."{1}"'.format(schema, name)
+                columns = [self.column(k) for k in range(self.columns)]
+
+                if kind == 'v':
+                    statements = [u"CREATE VIEW {0} AS SELECT {1}".format(
+                        target, u", ".join(u"NULL::{0} AS {1}".format(c[4],
+                                                                      c[0])
+                                           for c in columns))]
+                else:
+                    definition = [u"{0} {1}{2}".format(
+                        c[0], c[4], k == 0 and u" NOT NULL" or u"")
+                        for k, c in enumerate(columns)]
+                    definition += [
+                        u"CONSTRAINT {0}_chk_{1:02d} CHECK ({2} IS NOT NULL)"
+                        .format(name, m, columns[m % self.columns][0])
+                        for m in range(self.constraints)]
+
+                    statements = [u"CREATE TABLE {0} ({1})".format(
+                        target, u", ".join(definition))]
+                    statements += [
+                        u"CREATE INDEX {0}_idx_{1:02d} ON {2} ({3})"
+                        .format(name, m, target,
+                                columns[m % self.columns][0])
+                        for m in range(self.indexes)]
+
+                statements.append(u"COMMENT ON {0} {1} IS {2}".format(
+                    kind == 'v' and u"VIEW" or u"TABLE", target,
+                    self.__literal(self.description(schema, name))))
+                statements += [
+                    u"COMMENT ON COLUMN {0}.{1} IS {2}".format(
+                        target, c[0],
+                        self.__literal(self.description(schema, name, c[0])))
+                    for c in columns]
+
+                yield u"; ".join(statements)
+
+    def drop(self):
+
+        """ Comandos que removem o catálogo criado por ddl() """
+
+        for schema in self.schema_names():
+            yield u'DROP SCHEMA IF EXISTS "{0}" CASCADE'.format(schema)
+
+    def __literal(self, value):
+        return u"'{0}'".format(value.replace(u"'", u"''"))
+
+
+def classify(statement):
+
+    """ Tipo de um comando: a chave em catalog.QUERIES, 'descriptions',
+        'comment' (lotes de COMMENT ON) ou a primeira palavra do comando.
+    """
+
+    if isinstance(statement, str):
+        statement = statement.decode('utf-8')
+
+    for key, query in catalog.QUERIES:
+        # Texto da consulta até o primeiro trecho variável
+        if statement.startswith(query.split("{")[0]):
+            return key
+
+    if statement == catalog.DESCRIPTIONS_QUERY:
+        return "descriptions"
+
+    if u"COMMENT ON " in statement:
+        return "comment"
+
+    return statement.split(None, 1)[0].lower()
+
+
+class FakeCursor(object):
+
+    """ Cursor de FakeConnection """
+
+    def __init__(self, conn, name=None):
+        self.connection = conn
+        self.name = name
+        self.itersize = 2000
+        self.rowcount = -1
+        self.__rows = []
+
+    def execute(self, statement, qargs=None):
+        self.__rows = self.connection.answer(statement, qargs)
+        self.rowcount = len(self.__rows)
+
+    def fetchall(self):
+        rows, self.__rows = self.__rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self.__rows = self.__rows[:size], self.__rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def mogrify(self, statement, qargs=None):
+        if qargs:
+            statement = statement % tuple(
+                u"'{0}'".format(a.replace(u"'", u"''")) for a in qargs)
+
+        return statement.encode('utf-8')
+
+    def close(self):
+        self.__rows = []
+
+
+class FakeConnection(object):
+
+    """ Conexão simulada, com a mesma API das conexões do psycopg2,
+        que responde às consultas do catálogo a partir de um
+        SyntheticCatalog e aceita os comandos de sincronização.
+    """
+
+    def __init__(self, synthetic):
+        self.synthetic = synthetic
+        self.autocommit = False
+        self.closed = 0
+        self.__in_transaction = False
+
+    def cursor(self, name=None):
+        if name is not None and self.autocommit:
+            raise psycopg2.ProgrammingError(
+                "can't use a named cursor outside of transactions")
+
+        return FakeCursor(self, name)
+
+    def answer(self, statement, qargs):
+
+        """ Linhas de resultado do comando 'statement' """
+
+        if not self.autocommit:
+            self.__in_transaction = True
+
+        kind = classify(statement)
+
+        if kind in dict(catalog.QUERIES):
+            names = qargs and qargs[0] or None
+            return list(self.synthetic.snapshot().rows(kind, names))
+
+        if kind == "descriptions":
+            return self.synthetic.descriptions(qargs["schema"])
+
+        if kind in ("comment", "savepoint", "release", "rollback",
+                    "set", "select"):
+            return []
+
+        raise NotImplementedError(
+            u"Comando não suportado pela conexão simulada: " + kind)
+
+    def get_transaction_status(self):
+        if self.__in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.__in_transaction = False
+
+    def rollback(self):
+        self.__in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+class Recorder(object):
+
+    """ Conta os comandos enviados ao banco de dados, por tipo, e
+        simula a latência da rede. Os contadores são compartilhados
+        entre os processos criados depois do Recorder.
+    """
+
+    KINDS = tuple(key for key, query in catalog.QUERIES) + (
+        "descriptions", "comment", "other")
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.__counts = multiprocessing.Array('l', len(Recorder.KINDS))
+
+    def connect(self, connect):
+
+        """ Retorna uma função de conexão que grava os comandos
+            das conexões abertas por 'connect'
+        """
+
+        return lambda dsn: RecordingConnection(connect(dsn), self)
+
+    def record(self, statement):
+        kind = classify(statement)
+        if kind not in Recorder.KINDS:
+            kind = "other"
+
+        with self.__counts.get_lock():
+            self.__counts[Recorder.KINDS.index(kind)] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset(self):
+        with self.__counts.get_lock():
+            for i in range(len(Recorder.KINDS)):
+                self.__counts[i] = 0
+
+    def counts(self):
+        return dict((kind, self.__counts[i])
+                    for i, kind in enumerate(Recorder.KINDS)
+                    if self.__counts[i])
+
+
+class RecordingCursor(object):
+
+    def __init__(self, cursor, recorder):
+        self.__dict__['_cursor'] = cursor
+        self.__dict__['_recorder'] = recorder
+
+    def execute(self, statement, qargs=None):
+        self._recorder.record(statement)
+        return self._cursor.execute(statement, qargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+class RecordingConnection(object):
+
+    """ Conexão que grava no Recorder os comandos de seus cursores """
+
+    def __init__(self, conn, recorder):
+        self.__dict__['_conn'] = conn
+        self.__dict__['_recorder'] = recorder
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self._conn.cursor(*args, **kwargs),
+                               self._recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+def __change_descriptions(path, changes):
+
+    """ Altera a descrição de uma fração 'changes' das colunas dos yamls
+        em 'path', para que sync_all tenha o que sincronizar.
+    """
+
+    rnd = random.Random(0)
+
+    for f in sorted(os.listdir(path)):
+        if not f.endswith(".yaml"):
+            continue
+
+        fname = os.path.join(path, f)
+        with open(fname) as stream:
+            dic = yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader',
+                                                   yaml.SafeLoader))
+
+        for rel in dic["3. tables"] + dic["4. views"]:
+            for column in rel["3. columns"]:
+                if rnd.random() < changes:
+                    column["2. description"] = u"Alterada"
+
+        with open(fname, "w") as stream:
+            yaml.safe_dump(dic, stream=stream, encoding='utf-8',
+                           allow_unicode=True, default_flow_style=False)
+
+
+def __scenario(name, path, jobs, recorder, queue):
+
+    """ Executa um cenário e envia as medições para 'queue'.
+        Executada em um processo próprio, para medir a memória.
+        Os comandos registrados pelo Tracer do processo, quando houver
+        um, são enviados em 'records' (ver __run_scenario). Em caso de
+        erro, envia somente o traceback em 'error'.
+    """
+
+    sys.stdout = open(os.devnull, "w")
+    recorder.reset()
+
+    tracer = Connection.tracer()
+    if tracer is not None:
+        tracer.reset()
+
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+
+    try:
+        if name == "doc_all":
+            doc.doc_all(path, jobs, force=True)
+        elif name == "all_yamls":
+            sync.all_yamls(path, jobs, force=True)
+        elif name == "sync_all":
+            sync.sync_all(path, jobs)
+    except Exception:
+        queue.put({"error": traceback.format_exc()})
+        return
+
+    wall = time.time() - start
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    queue.put({"wall": wall, "peak_rss_kb": rss,
+               "queries": recorder.counts(),
+               "records": tracer is not None and tracer.records or []})
+
+
+def __run_scenario(name, path, jobs, recorder):
+
+    """ Executa o cenário em outro processo e retorna as medições.
+        Os comandos registrados pelo processo são reunidos no Tracer
+        do processo atual, quando houver um (como em workers.run).
+    """
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=__scenario, args=(name, path, jobs, recorder, queue))
+    process.start()
+
+    # O processo pode terminar sem enviar nada (ex: morto pelo sistema)
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+            try:
+                result = queue.get(timeout=1)
+            except Queue.Empty:
+                raise RuntimeError(
+                    "O cenário '%s' terminou sem resultados (código %s)"
+                    % (name, process.exitcode))
+
+    process.join()
+
+    if "error" in result:
+        raise RuntimeError("Erro no cenário '%s':\n%s"
+                           % (name, result["error"]))
+
+    records = result.pop("records")
+    tracer = Connection.tracer()
+    if tracer is not None:
+        tracer.extend(records)
+
+    return result
+
+
+def __commit():
+
+    """ Commit atual do repositório do docgen, quando disponível """
+
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def __previous(output, record):
+
+    """ Último resultado salvo em 'output' com os mesmos parâmetros """
+
+    previous = None
+
+    if not os.path.isfile(output):
+        return previous
+
+    with open(output) as fo:
+        for line in fo:
+            r = json.loads(line)
+            if all(r.get(k) == record[k]
+                   for k in ("scenario", "backend", "params", "jobs",
+                             "latency")):
+                previous = r
+
+    return previous
+
+
+def __report(record, previous):
+    queries = sum(record["queries"].values())
+    line = ("{scenario:<10} {wall:8.3f}s {queries:7d} consultas "
+            "{rss:9d} KB {rels:10.0f} relações/s {cols:11.0f} colunas/s"
+            .format(scenario=record["scenario"], wall=record["wall"],
+                    queries=queries, rss=record["peak_rss_kb"],
+                    rels=record["relations_per_second"],
+                    cols=record["columns_per_second"]))
+
+    if previous is not None:
+        line += " (anterior {0}: {1:.3f}s, {2:+.1f}%)".format(
+            previous.get("commit"), previous["wall"],
+            (record["wall"] / previous["wall"] - 1) * 100)
+
+    print line
+
+
+def run(synthetic, dsn=None, latency=0.0, jobs=1, changes=0.01,
+        scenarios=SCENARIOS, output="benchmark.jsonl", keep=False):
+
+    """ Executa os cenários 'scenarios' sobre o catálogo sintético e
+        salva os resultados em 'output' (um JSON por linha).
+
+        Com 'dsn', o catálogo é criado nesse banco de dados PostgreSQL
+        (que deve ser exclusivo para o benchmark) e removido ao fim,
+        a não ser que 'keep' seja verdadeiro. Caso contrário, as
+        consultas são respondidas por FakeConnection. 'latency' é o
+        tempo, em segundos, acrescentado a cada comando.
+    """
+
+    recorder = Recorder(latency)
+
+    if dsn is None:
+        backend = "fake"
+        connect = lambda dsn: FakeConnection(synthetic)
+    else:
+        backend = "postgresql"
+        connect = psycopg2.connect
+
+        print "Criando %d relações em '%s'..." % (synthetic.relation_count(),
+                                                 dsn)
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        for statement in synthetic.drop():
+            cursor.execute(statement)
+        for statement in synthetic.ddl():
+            cursor.execute(statement)
+
+    Connection.configure(dsn=dsn or "fake", connect=recorder.connect(connect))
+    path = tempfile.mkdtemp(prefix="docgen-bench-")
+
+    try:
+        for name in scenarios:
+            if name == "sync_all":
+                __run_scenario("all_yamls", path, jobs, recorder)
+                __change_descriptions(path, changes)
+
+            record = {
+                "scenario": name,
+                "backend": backend,
+                "params": synthetic.params(),
+                "jobs": jobs,
+                "latency": latency,
+                "commit": __commit(),
+                "date": datetime.datetime.now().isoformat(),
+            }
+            record.update(__run_scenario(name, path, jobs, recorder))
+            record["relations_per_second"] = (synthetic.relation_count() /
+                                              record["wall"])
+            record["columns_per_second"] = (synthetic.column_count() /
+                                            record["wall"])
+
+            __report(record, __previous(output, record))
+
+            with open(output, "a") as fo:
+                fo.write(json.dumps(record, sort_keys=True) + "\n")
+
+    finally:
+        shutil.rmtree(path)
+
+        if dsn is not None and not keep:
+            for statement in synthetic.drop():
+                cursor.execute(statement)
+            conn.close()
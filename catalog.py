@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+import Queue
+import string
+import sys
+import threading
+
+import profiling
+from connection import Connection
+from models import Schema, Table, View, Column, Index, Constraint
+
+
+# Restrição comum a todas as consultas: ignora os schemas internos
+# do PostgreSQL e, opcionalmente, limita aos schemas pedidos e aos
+# aceitos pelo filtro. As relações também são filtradas ({relations}).
+__NAMESPACE_FILTER = (
+    "ns.nspname != 'information_schema' "
+    "AND ns.nspname NOT LIKE 'pg_%%' ")
+
+SCHEMAS_QUERY = (
+    "SELECT ns.oid, ns.nspname, d.description "
+    "FROM pg_catalog.pg_namespace ns "
+    "LEFT JOIN pg_catalog.pg_description d "
+    "ON d.objoid = ns.oid "
+    "AND d.classoid = 'pg_catalog.pg_namespace'::regclass "
+    "AND d.objsubid = 0 "
+    "WHERE {filter} "
+    "ORDER BY ns.nspname")
+
+RELATIONS_QUERY = (
+    "SELECT c.oid, c.relnamespace, c.relname, c.relkind, d.description "
+    "FROM pg_catalog.pg_class c "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "LEFT JOIN pg_catalog.pg_description d "
+    "ON d.objoid = c.oid "
+    "AND d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid = 0 "
+    "WHERE c.relkind IN ('r', 'p', 'v') "
+    "AND (pg_catalog.pg_has_role(c.relowner, 'USAGE') "
+    "OR pg_catalog.has_table_privilege(c.oid, "
+    "'SELECT, INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER') "
+    "OR pg_catalog.has_any_column_privilege(c.oid, "
+    "'SELECT, INSERT, UPDATE, REFERENCES')) "
+    "AND {filter}{relations}"
+    "ORDER BY c.relname")
+
+# Mesmas expressões usadas pela view information_schema.columns,
+# para manter os valores de data_type, is_nullable etc. idênticos.
+ATTRIBUTES_QUERY = (
+    "SELECT a.attrelid, a.attname, d.description, "
+    "pg_catalog.pg_get_expr(ad.adbin, ad.adrelid) AS column_default, "
+    "CASE WHEN a.attnotnull OR (t.typtype = 'd' AND t.typnotnull) "
+    "THEN 'NO' ELSE 'YES' END AS is_nullable, "
+    "CASE WHEN t.typtype = 'd' THEN "
+    "CASE WHEN bt.typelem <> 0 AND bt.typlen = -1 THEN 'ARRAY' "
+    "WHEN nbt.nspname = 'pg_catalog' "
+    "THEN pg_catalog.format_type(t.typbasetype, NULL) "
+    "ELSE 'USER-DEFINED' END "
+    "ELSE "
+    "CASE WHEN t.typelem <> 0 AND t.typlen = -1 THEN 'ARRAY' "
+    "WHEN nt.nspname = 'pg_catalog' "
+    "THEN pg_catalog.format_type(a.atttypid, NULL) "
+    "ELSE 'USER-DEFINED' END "
+    "END AS data_type, "
+    "information_schema._pg_char_max_length("
+    "information_schema._pg_truetypid(a.*, t.*), "
+    "information_schema._pg_truetypmod(a.*, t.*)) "
+    "AS character_maximum_length, "
+    "information_schema._pg_numeric_precision("
+    "information_schema._pg_truetypid(a.*, t.*), "
+    "information_schema._pg_truetypmod(a.*, t.*)) "
+    "AS numeric_precision "
+    "FROM pg_catalog.pg_attribute a "
+    "JOIN pg_catalog.pg_class c ON c.oid = a.attrelid "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "JOIN pg_catalog.pg_type t ON t.oid = a.atttypid "
+    "JOIN pg_catalog.pg_namespace nt ON nt.oid = t.typnamespace "
+    "LEFT JOIN (pg_catalog.pg_type bt "
+    "JOIN pg_catalog.pg_namespace nbt ON nbt.oid = bt.typnamespace) "
+    "ON t.typtype = 'd' AND t.typbasetype = bt.oid "
+    "LEFT JOIN pg_catalog.pg_attrdef ad "
+    "ON ad.adrelid = a.attrelid AND ad.adnum = a.attnum "
+    "LEFT JOIN pg_catalog.pg_description d "
+    "ON d.objoid = a.attrelid "
+    "AND d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid = a.attnum "
+    "WHERE a.attnum > 0 AND NOT a.attisdropped "
+    "AND c.relkind IN ('r', 'p', 'v') "
+    "AND (pg_catalog.pg_has_role(c.relowner, 'USAGE') "
+    "OR pg_catalog.has_column_privilege(c.oid, a.attnum, "
+    "'SELECT, INSERT, UPDATE, REFERENCES')) "
+    "AND {filter}{relations}"
+    "ORDER BY a.attrelid, a.attnum")
+
+INDEXES_QUERY = (
+    "SELECT idx.indrelid, i.relname, am.amname, "
+    "ARRAY("
+    "SELECT pg_catalog.pg_get_indexdef(idx.indexrelid, k + 1, true) "
+    "FROM pg_catalog.generate_subscripts(idx.indkey, 1) AS k "
+    "ORDER BY k"
+    ") AS indkey_names "
+    "FROM pg_catalog.pg_index idx "
+    "JOIN pg_catalog.pg_class i ON i.oid = idx.indexrelid "
+    "JOIN pg_catalog.pg_am am ON am.oid = i.relam "
+    "JOIN pg_catalog.pg_class c ON c.oid = idx.indrelid "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "WHERE c.relkind IN ('r', 'p') "
+    "AND {filter}{relations}"
+    "ORDER BY idx.indrelid, idx.indexrelid")
+
+CONSTRAINTS_QUERY = (
+    "SELECT r.conrelid, r.conname, "
+    "pg_catalog.pg_get_constraintdef(r.oid, true) AS condef "
+    "FROM pg_catalog.pg_constraint r "
+    "JOIN pg_catalog.pg_class c ON c.oid = r.conrelid "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "WHERE c.relkind IN ('r', 'p') "
+    "AND {filter}{relations}"
+    "ORDER BY r.conrelid, r.oid")
+
+# Impressão digital de cada schema: md5 do estado do catálogo que aparece
+# na documentação (relações, colunas, defaults, índices, constraints e
+# descrições). Muda sempre que algum desses objetos é alterado.
+FINGERPRINTS_QUERY = (
+    "SELECT ns.nspname, md5(concat_ws('|', "
+    "(SELECT d.description FROM pg_catalog.pg_description d "
+    "WHERE d.objoid = ns.oid "
+    "AND d.classoid = 'pg_catalog.pg_namespace'::regclass "
+    "AND d.objsubid = 0), "
+    "(SELECT string_agg(format('%%L,%%L,%%L', c.relname, c.relkind, "
+    "d.description), ';' ORDER BY c.relname) "
+    "FROM pg_catalog.pg_class c "
+    "LEFT JOIN pg_catalog.pg_description d "
+    "ON d.objoid = c.oid "
+    "AND d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid = 0 "
+    "WHERE c.relnamespace = ns.oid AND c.relkind IN ('r', 'p', 'v') "
+    "{relations}), "
+    "(SELECT string_agg(format('%%L,%%L,%%L,%%L,%%L,%%L,%%L,%%L', "
+    "c.relname, a.attnum, a.attname, a.atttypid, a.atttypmod, "
+    "a.attnotnull, pg_catalog.pg_get_expr(ad.adbin, ad.adrelid), "
+    "d.description), ';' ORDER BY c.relname, a.attnum) "
+    "FROM pg_catalog.pg_attribute a "
+    "JOIN pg_catalog.pg_class c ON c.oid = a.attrelid "
+    "LEFT JOIN pg_catalog.pg_attrdef ad "
+    "ON ad.adrelid = a.attrelid AND ad.adnum = a.attnum "
+    "LEFT JOIN pg_catalog.pg_description d "
+    "ON d.objoid = a.attrelid "
+    "AND d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid = a.attnum "
+    "WHERE c.relnamespace = ns.oid AND c.relkind IN ('r', 'p', 'v') "
+    "AND a.attnum > 0 AND NOT a.attisdropped {relations}), "
+    "(SELECT string_agg(pg_catalog.pg_get_indexdef(idx.indexrelid), ';' "
+    "ORDER BY idx.indexrelid) "
+    "FROM pg_catalog.pg_index idx "
+    "JOIN pg_catalog.pg_class c ON c.oid = idx.indrelid "
+    "WHERE c.relnamespace = ns.oid AND c.relkind IN ('r', 'p') "
+    "{relations}), "
+    "(SELECT string_agg(format('%%L,%%L,%%L', c.relname, r.conname, "
+    "pg_catalog.pg_get_constraintdef(r.oid, true)), ';' ORDER BY r.oid) "
+    "FROM pg_catalog.pg_constraint r "
+    "JOIN pg_catalog.pg_class c ON c.oid = r.conrelid "
+    "WHERE c.relnamespace = ns.oid AND c.relkind IN ('r', 'p') "
+    "{relations}))) "
+    "FROM pg_catalog.pg_namespace ns "
+    "WHERE {filter}")
+
+# Descrições atuais de um schema e de suas relações e colunas.
+# Objetos sem descrição não são retornados.
+DESCRIPTIONS_QUERY = (
+    "SELECT 'SCHEMA', ns.nspname, NULL, NULL, d.description "
+    "FROM pg_catalog.pg_namespace ns "
+    "JOIN pg_catalog.pg_description d "
+    "ON d.objoid = ns.oid "
+    "AND d.classoid = 'pg_catalog.pg_namespace'::regclass "
+    "AND d.objsubid = 0 "
+    "WHERE ns.nspname = %(schema)s "
+    "UNION ALL "
+    "SELECT CASE c.relkind WHEN 'v' THEN 'VIEW' ELSE 'TABLE' END, "
+    "ns.nspname, c.relname, NULL, d.description "
+    "FROM pg_catalog.pg_class c "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "JOIN pg_catalog.pg_description d "
+    "ON d.objoid = c.oid "
+    "AND d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid = 0 "
+    "WHERE ns.nspname = %(schema)s AND c.relkind IN ('r', 'p', 'v') "
+    "UNION ALL "
+    "SELECT 'COLUMN', ns.nspname, c.relname, a.attname, d.description "
+    "FROM pg_catalog.pg_description d "
+    "JOIN pg_catalog.pg_class c ON c.oid = d.objoid "
+    "JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace "
+    "JOIN pg_catalog.pg_attribute a "
+    "ON a.attrelid = c.oid AND a.attnum = d.objsubid "
+    "WHERE d.classoid = 'pg_catalog.pg_class'::regclass "
+    "AND d.objsubid > 0 "
+    "AND ns.nspname = %(schema)s AND c.relkind IN ('r', 'p', 'v')")
+
+
+def __filter(names, filter=None):
+
+    """ Retorna os trechos do WHERE que restringem os schemas ('filter')
+        e as relações ('relations') consultados, com os seus argumentos.
+        'filter' é um objeto filters.Filter ou None.
+    """
+
+    schemas, qargs = __NAMESPACE_FILTER, []
+
+    if names is not None:
+        schemas += "AND ns.nspname = ANY(%s) "
+        qargs.append(list(names))
+
+    if filter is None:
+        return {"filter": (schemas, qargs), "relations": ("", [])}
+
+    sql, args = filter.condition('schemas', 'ns.nspname')
+
+    return {"filter": (schemas + sql, qargs + args),
+            "relations": filter.condition('relations', 'c.relname')}
+
+
+def __query(query, names, filter=None, origin=None):
+    clauses = __filter(names, filter)
+
+    # Os argumentos seguem a ordem em que os trechos aparecem na consulta
+    qargs = []
+    for text, field, spec, conversion in string.Formatter().parse(query):
+        if field is not None:
+            qargs.extend(clauses[field][1])
+
+    where = dict((field, sql) for field, (sql, args) in clauses.items())
+    return Connection.stream(query.format(**where), qargs, origin=origin)
+
+
+# Consultas que compõem o catálogo, na ordem em que são montadas.
+QUERIES = (
+    ("schemas", SCHEMAS_QUERY),
+    ("relations", RELATIONS_QUERY),
+    ("attributes", ATTRIBUTES_QUERY),
+    ("indexes", INDEXES_QUERY),
+    ("constraints", CONSTRAINTS_QUERY),
+    ("fingerprints", FINGERPRINTS_QUERY),
+)
+
+
+def fetch(key, names=None, snapshot=None, filter=None, origin=None):
+
+    """ Retorna as linhas da consulta 'key' de QUERIES, do banco de dados
+        ou do objeto Snapshot 'snapshot', caso indicado. As linhas do
+        banco de dados são lidas aos poucos (ver Connection.stream) e
+        devem ser percorridas uma única vez. 'origin' é a origem
+        registrada pelo tracer, quando a consulta é feita em outra thread.
+    """
+
+    if snapshot is not None:
+        return snapshot.rows(key, names, filter)
+
+    return __query(dict(QUERIES)[key], names, filter, origin)
+
+
+# Linhas enviadas por vez pela thread de uma consulta e número máximo
+# de lotes aguardando na fila (ver Prefetch)
+PREFETCH_CHUNK = 500
+PREFETCH_CHUNKS = 8
+
+
+class Prefetch(object):
+
+    """ Inicia imediatamente a consulta 'key' em uma thread, com a sua
+        própria conexão do pool. As linhas podem ser percorridas à
+        medida que chegam; a thread lê no máximo PREFETCH_CHUNKS lotes
+        à frente do consumidor. close() interrompe a leitura.
+
+        Com o tracer ativo, a consulta é atribuída a quem criou o
+        Prefetch, e não à thread que a executa.
+    """
+
+    def __init__(self, key, names, filter=None):
+        origin = None
+        if Connection.tracer() is not None:
+            origin = profiling.caller()
+
+        self.__chunks = Queue.Queue(PREFETCH_CHUNKS)
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__produce,
+                                         args=(key, names, filter, origin))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __put(self, item):
+
+        """ Coloca 'item' na fila, desistindo caso o consumidor
+            tenha parado de ler. Retorna False nesse caso.
+        """
+
+        while not self.__stop.is_set():
+            try:
+                self.__chunks.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+
+        return False
+
+    def __produce(self, key, names, filter, origin):
+        rows = fetch(key, names, filter=filter, origin=origin)
+
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= PREFETCH_CHUNK:
+                    if not self.__put(("rows", chunk)):
+                        return
+                    chunk = []
+
+            if self.__put(("rows", chunk)):
+                self.__put(("end", None))
+        except Exception:
+            self.__put(("error", sys.exc_info()))
+        finally:
+            rows.close()
+
+    def __iter__(self):
+        try:
+            while True:
+                kind, value = self.__chunks.get()
+
+                if kind == "end":
+                    return
+                elif kind == "error":
+                    raise value[0], value[1], value[2]
+
+                for row in value:
+                    yield row
+        finally:
+            self.close()
+
+    def close(self):
+        self.__stop.set()
+        self.__thread.join()
+
+
+def __fetch_all(names, snapshot, filter):
+
+    """ Retorna as linhas de cada consulta usada por load(), indexadas
+        pela chave.
+
+        Sem snapshot, as consultas são enviadas ao mesmo tempo, cada uma
+        em uma conexão do pool, para que as suas latências se sobreponham.
+        As que excedem o tamanho do pool são iniciadas somente quando
+        lidas, depois que as anteriores liberaram suas conexões.
+    """
+
+    keys = [key for key, query in QUERIES if key != "fingerprints"]
+
+    if snapshot is not None:
+        return dict((key, fetch(key, names, snapshot, filter))
+                    for key in keys)
+
+    concurrent = Connection.pool().maxconn
+
+    rows = {}
+    for i, key in enumerate(keys):
+        if i < concurrent:
+            rows[key] = Prefetch(key, names, filter)
+        else:
+            rows[key] = fetch(key, names, filter=filter)
+
+    return rows
+
+
+def load(names=None, snapshot=None, filter=None):
+
+    """ Carrega o catálogo do banco de dados com um número fixo de
+        consultas e retorna a lista de objetos Schema com tabelas,
+        views, colunas, índices e constraints já preenchidos.
+
+        'names' limita a carga aos schemas com os nomes indicados.
+        Caso seja None, todos os schemas são carregados. 'filter' (um
+        objeto filters.Filter) exclui schemas e relações da própria
+        consulta. Com 'snapshot', o catálogo é lido do objeto Snapshot, sem
+        nenhum acesso ao banco de dados.
+    """
+
+    rows = __fetch_all(names, snapshot, filter)
+
+    try:
+        return __assemble(rows)
+    finally:
+        # Interrompe as consultas que não foram lidas até o fim
+        for r in rows.values():
+            if hasattr(r, "close"):
+                r.close()
+
+
+def __assemble(rows):
+
+    """ Monta os objetos Schema a partir das linhas de __fetch_all """
+
+    schemas = []
+    schemas_by_oid = {}
+    for oid, name, description in rows["schemas"]:
+        s = Schema(name=name, description=description)
+        s.set_tables([])
+        s.set_views([])
+        schemas.append(s)
+        schemas_by_oid[oid] = s
+
+    if not schemas:
+        return schemas
+
+    relations = {}
+    for oid, nspoid, name, kind, description in rows["relations"]:
+        s = schemas_by_oid.get(nspoid)
+        if s is None:
+            continue
+
+        if kind == 'v':
+            rel = View(schema=s.name, name=name, description=description)
+            s.views().append(rel)
+        else:
+            rel = Table(schema=s.name, name=name, description=description)
+            rel.set_indexes([])
+            rel.set_constraints([])
+            s.tables().append(rel)
+
+        rel.set_columns([])
+        relations[oid] = rel
+
+    # Os valores de poucas variações (tipos, defaults, is_nullable) são
+    # compartilhados entre as colunas, em vez de um objeto por coluna.
+    # O nome do schema e da tabela vêm da própria relação.
+    shared = {}
+    share = shared.setdefault
+
+    for r in rows["attributes"]:
+        rel = relations.get(r[0])
+        if rel is None:
+            continue
+
+        rel.columns().append(
+            Column(schema=rel.schema, table=rel.name, name=r[1],
+                   description=r[2], default=share(r[3], r[3]),
+                   is_nullable=share(r[4], r[4]),
+                   data_type=share(r[5], r[5]),
+                   character_maximum_length=r[6],
+                   numeric_precision=r[7]))
+
+    for relid, name, itype, fields in rows["indexes"]:
+        rel = relations.get(relid)
+        if rel is None:
+            continue
+
+        rel.indexes().append(Index(name=name, itype=itype, fields=fields))
+
+    for relid, name, definition in rows["constraints"]:
+        rel = relations.get(relid)
+        if rel is None:
+            continue
+
+        rel.constraints().append(Constraint(name=name, definition=definition))
+
+    return schemas
+
+
+def fingerprints(names=None, snapshot=None, filter=None):
+
+    """ Retorna um dicionário com a impressão digital do catálogo
+        de cada schema, indexado pelo nome do schema.
+
+        'names' limita a consulta aos schemas com os nomes indicados e
+        'filter' aos schemas e relações aceitos pelo filtro.
+    """
+
+    return dict(fetch("fingerprints", names, snapshot, filter))
+
+
+def load_schema(name, snapshot=None, filter=None):
+
+    """ Carrega um único schema de nome 'name' com todo o seu conteúdo.
+        None caso não haja nenhum (ou caso seja excluído por 'filter').
+    """
+
+    schemas = load([name], snapshot, filter)
+
+    if schemas:
+        return schemas[0]
+    else:
+        return None
+
+
+def descriptions(name):
+
+    """ Retorna um dicionário com as descrições atuais do schema 'name',
+        de suas tabelas, views e colunas, indexado pela chave
+        (tipo, identificação) usada pelos objetos Comment.
+    """
+
+    data = Connection.query(DESCRIPTIONS_QUERY, {"schema": name})
+
+    return dict(((r[0], tuple(i for i in r[1:4] if i is not None)), r[4])
+                for r in data)
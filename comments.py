@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import random
+import time
+import warnings
+from exceptions import RuntimeWarning
+
+import psycopg2
+
+from connection import Connection
+
+
+class Comment(object):
+
+    """ Representa a descrição (COMMENT ON) de um objeto do banco de dados """
+
+    SCHEMA = "SCHEMA"
+    TABLE = "TABLE"
+    VIEW = "VIEW"
+    COLUMN = "COLUMN"
+
+    __slots__ = ('kind', 'identity', 'description')
+
+    __LABELS = {
+        SCHEMA: u"o schema",
+        TABLE: u"a tabela",
+        VIEW: u"a view",
+        COLUMN: u"a coluna",
+    }
+
+    def __init__(self, kind, identity, description):
+        self.kind = kind
+        self.identity = identity
+        self.description = description
+
+    def key(self):
+
+        """ Chave que identifica o objeto descrito """
+
+        return (self.kind, self.identity)
+
+    def label(self):
+
+        """ Descrição do objeto usada nas mensagens, ex: 'a tabela s.t' """
+
+        return u"{0} {1}".format(Comment.__LABELS[self.kind],
+                                 u".".join(self.identity))
+
+    def statement(self):
+
+        """ Retorna a tupla (comando, argumentos) do COMMENT ON do objeto """
+
+        if self.kind == Comment.SCHEMA:
+            target = u"{0}".format(*self.identity)
+        else:
+            target = u".".join(u'"{0}"'.format(i) for i in self.identity)
+
+        if self.description is not None:
+            return (u"COMMENT ON {0} {1} IS %s".format(self.kind, target),
+                    (self.description,))
+        else:
+            return (u"COMMENT ON {0} {1} IS NULL".format(self.kind, target),
+                    None)
+
+
+class CommentDiff(object):
+
+    """ Compara descrições com as descrições atuais do banco de dados,
+        mantendo somente as que foram adicionadas, alteradas ou removidas.
+    """
+
+    def __init__(self, current):
+
+        """ 'current' é um dicionário com as descrições atuais
+            indexado por Comment.key()
+        """
+
+        self.current = current
+        self.added = 0
+        self.changed = 0
+        self.cleared = 0
+        self.unchanged = 0
+
+    def filter(self, comments):
+
+        """ Retorna somente as descrições de 'comments' que diferem
+            das descrições atuais
+        """
+
+        for comment in comments:
+            # O PostgreSQL remove a descrição quando ela é vazia
+            old = self.current.get(comment.key()) or None
+            new = comment.description or None
+
+            if old == new:
+                self.unchanged += 1
+                continue
+
+            if old is None:
+                self.added += 1
+            elif new is None:
+                self.cleared += 1
+            else:
+                self.changed += 1
+
+            yield comment
+
+
+class CommentWriter(object):
+
+    """ Aplica descrições no banco de dados em lotes, cada lote em sua
+        própria transação, para que os bloqueios de cada tabela durem
+        somente até o fim do lote. Cada lote é protegido por um
+        savepoint: caso algum comando do lote falhe, o lote é refeito
+        comando a comando, cada um com o seu próprio savepoint, e
+        somente os objetos com erro são descartados.
+
+        Os comandos respeitam 'lock_timeout' e 'statement_timeout', para
+        nunca ficarem na fila de bloqueios de uma tabela movimentada.
+        Quando uma relação (ou schema) não pode ser bloqueada, todas as
+        suas descrições são deixadas para o fim, sem esperar novamente
+        por cada coluna, e tentadas outra vez 'retries' vezes, uma
+        transação por relação, com intervalos crescentes e aleatórios a
+        partir de 'backoff' segundos. As que ainda assim falharem ficam
+        em 'busy'.
+    """
+
+    BATCH_SIZE = 500
+    LOCK_TIMEOUT = '2s'
+    STATEMENT_TIMEOUT = '30s'
+    RETRIES = 3
+    BACKOFF = 1.0
+
+    # lock_not_available (lock_timeout) e query_canceled
+    # (statement_timeout)
+    LOCK_ERRORS = ('55P03', '57014')
+
+    def __init__(self, batch_size=BATCH_SIZE, lock_timeout=None,
+                 statement_timeout=None, retries=RETRIES, backoff=BACKOFF):
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout or CommentWriter.LOCK_TIMEOUT
+        self.statement_timeout = (statement_timeout or
+                                  CommentWriter.STATEMENT_TIMEOUT)
+        self.retries = retries
+        self.backoff = backoff
+        self.applied = 0
+        self.failed = []
+        self.busy = []
+        self.__deferred = []
+        self.__locked = set()
+
+    @staticmethod
+    def __relation(comment):
+
+        """ Objeto bloqueado pelo COMMENT ON: o schema ou a relação """
+
+        if comment.kind == Comment.SCHEMA:
+            return comment.identity
+
+        return comment.identity[:2]
+
+    def apply(self, comments):
+
+        """ Aplica todas as descrições de 'comments' e retorna o número
+            de objetos atualizados.
+        """
+
+        batch = []
+        for comment in comments:
+            if CommentWriter.__relation(comment) in self.__locked:
+                self.__deferred.append(comment)
+                continue
+
+            batch.append(comment)
+            if len(batch) >= self.batch_size:
+                self.__commit(batch)
+                batch = []
+
+        if batch:
+            self.__commit(batch)
+
+        for attempt in range(self.retries):
+            if not self.__deferred:
+                break
+
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+            pending, self.__deferred = self.__deferred, []
+            self.__locked = set()
+
+            for _, group in self.__by_relation(pending):
+                self.__commit(group)
+
+        for relation, group in self.__by_relation(self.__deferred):
+            self.busy.extend(group)
+            warnings.warn(
+                u"Objeto bloqueado, {0} descrição(ões) não sincronizada(s): "
+                u"{1}".format(len(group), u".".join(relation))
+                .encode('utf-8'),
+                RuntimeWarning)
+        self.__deferred = []
+        self.__locked = set()
+
+        return self.applied
+
+    def __by_relation(self, comments):
+
+        """ Agrupa 'comments' por relação, na ordem em que aparecem """
+
+        groups = {}
+        order = []
+        for comment in comments:
+            relation = CommentWriter.__relation(comment)
+            if relation not in groups:
+                groups[relation] = []
+                order.append(relation)
+            groups[relation].append(comment)
+
+        return [(r, groups[r]) for r in order]
+
+    def __set_timeouts(self, cursor):
+        cursor.execute("SET LOCAL lock_timeout = %s;"
+                       "SET LOCAL statement_timeout = %s",
+                       (self.lock_timeout, self.statement_timeout))
+
+    def __commit(self, batch):
+
+        """ Aplica um lote em sua própria transação """
+
+        with Connection.transaction() as cursor:
+            self.__set_timeouts(cursor)
+            self.__flush(cursor, batch)
+
+    def __flush(self, cursor, batch):
+
+        """ Envia um lote de comandos em uma única ida ao servidor """
+
+        statements = [cursor.mogrify(*c.statement()) for c in batch]
+
+        try:
+            cursor.execute("SAVEPOINT docgen_batch;" +
+                           ";".join(statements) +
+                           ";RELEASE SAVEPOINT docgen_batch")
+            self.applied += len(batch)
+
+        except psycopg2.Error, e:
+            cursor.execute("ROLLBACK TO SAVEPOINT docgen_batch")
+
+            # Um lote de uma única relação (ex: nas novas tentativas) que
+            # não pôde ser bloqueada é adiado sem esperar por cada item
+            relations = set(CommentWriter.__relation(c) for c in batch)
+            if e.pgcode in CommentWriter.LOCK_ERRORS and len(relations) == 1:
+                self.__locked.update(relations)
+
+            for comment, statement in zip(batch, statements):
+                # Não espera de novo por uma relação já bloqueada
+                if CommentWriter.__relation(comment) in self.__locked:
+                    self.__deferred.append(comment)
+                else:
+                    self.__execute_one(cursor, comment, statement)
+
+            cursor.execute("RELEASE SAVEPOINT docgen_batch")
+
+    def __execute_one(self, cursor, comment, statement):
+        try:
+            cursor.execute("SAVEPOINT docgen_item;" + statement +
+                           ";RELEASE SAVEPOINT docgen_item")
+            self.applied += 1
+
+        except psycopg2.Error, e:
+            cursor.execute("ROLLBACK TO SAVEPOINT docgen_item")
+
+            if e.pgcode in CommentWriter.LOCK_ERRORS:
+                self.__locked.add(CommentWriter.__relation(comment))
+                self.__deferred.append(comment)
+                return
+
+            self.failed.append(comment)
+            warnings.warn(
+                u"Erro ao sincronizar {0}: {1}"
+                .format(comment.label(),
+                        str(e).decode('utf-8', 'replace').strip())
+                .encode('utf-8'),
+                RuntimeWarning)
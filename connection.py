@@ -1,30 +1,326 @@
 # -*- coding: utf-8 -*-
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 import psycopg2.extensions
 
-from local_settings import PG_PARAMS
-
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY)
 
 
+class Pool(object):
+
+    """ Pool limitado e thread-safe de conexões com o banco de dados.
+
+        As conexões são abertas somente quando necessárias, até o
+        limite de 'maxconn'. Quando todas estão em uso, get() espera
+        alguma ser devolvida. Conexões que ficaram paradas por mais de
+        'ping_after' segundos são testadas antes de serem reutilizadas.
+        'connect' é a função que abre uma conexão a partir do dsn.
+    """
+
+    def __init__(self, dsn, maxconn=4, ping_after=30,
+                 connect=psycopg2.connect):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.connect = connect
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self.__idle = []
+        self.__size = 0
+        self.__cond = threading.Condition()
+
+    def get(self):
+
+        """ Retorna uma conexão livre do pool, abrindo uma nova caso
+            necessário.
+        """
+
+        while True:
+            with self.__cond:
+                while not self.__idle and self.__size >= self.maxconn:
+                    self.__cond.wait()
+
+                if self.__idle:
+                    conn, since = self.__idle.pop()
+                else:
+                    self.__size += 1
+                    conn = None
+
+            if conn is None:
+                try:
+                    return self.__connect()
+                except:
+                    self.__discard(None)
+                    raise
+
+            if self.__healthy(conn, since):
+                return conn
+
+            self.__discard(conn)
+
+    def put(self, conn):
+
+        """ Devolve ao pool uma conexão obtida com get() """
+
+        status = (conn.closed and
+                  psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN or
+                  conn.get_transaction_status())
+
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            self.__discard(conn)
+            return
+
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self.__discard(conn)
+                return
+
+        with self.__cond:
+            self.__idle.append((conn, time.time()))
+            self.__cond.notify()
+
+    def close(self):
+
+        """ Fecha as conexões livres do pool """
+
+        with self.__cond:
+            idle, self.__idle = self.__idle, []
+            self.__size -= len(idle)
+            self.__cond.notify_all()
+
+        for conn, since in idle:
+            conn.close()
+
+    def __connect(self):
+        conn = self.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def __healthy(self, conn, since):
+        if conn.closed:
+            return False
+
+        if time.time() - since < self.ping_after:
+            return True
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def __discard(self, conn):
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+        with self.__cond:
+            self.__size -= 1
+            self.__cond.notify()
+
+
 class Connection(object):
 
-    __connection = psycopg2.connect(PG_PARAMS)
-    __connection.autocommit = True
+    """ Acesso ao banco de dados configurado em local_settings.
+
+        Nenhuma conexão é aberta até a primeira consulta. As consultas
+        usam conexões de um Pool compartilhado pelas threads do processo.
+    """
+
+    MAX_CONNECTIONS = 4
+
+    # Linhas trazidas do servidor por vez pelos cursores de stream()
+    ITERSIZE = 2000
+
+    __dsn = None
+    __maxconn = None
+    __connect = staticmethod(psycopg2.connect)
+    __pool = None
+    __lock = threading.Lock()
+    __tracer = None
+    __names = itertools.count(1)
+
+    # Pools herdados de outro processo (fork). Suas conexões não podem
+    # ser fechadas pelo processo filho, pois isso encerraria as sessões
+    # do processo pai.
+    __inherited = []
+
+    @staticmethod
+    def configure(dsn=None, maxconn=None, connect=None):
+
+        """ Altera o banco de dados e o tamanho do pool. Valores None
+            mantêm os de local_settings.
+
+            'connect' substitui psycopg2.connect na abertura das conexões
+            (ex: pelas conexões simuladas de benchmark.py).
+        """
+
+        with Connection.__lock:
+            pool = Connection.__pool
+
+            if pool is not None and pool.pid != os.getpid():
+                Connection.__inherited.append(pool)
+            elif pool is not None:
+                pool.close()
+
+            Connection.__pool = None
+            Connection.__dsn = dsn
+            Connection.__maxconn = maxconn
+            Connection.__connect = staticmethod(connect or psycopg2.connect)
+
+    @staticmethod
+    def pool():
+
+        """ Retorna o pool de conexões do processo atual,
+            criando-o caso necessário.
+        """
+
+        with Connection.__lock:
+            pool = Connection.__pool
+
+            if pool is not None and pool.pid != os.getpid():
+                Connection.__inherited.append(pool)
+                pool = None
+
+            if pool is None:
+                import local_settings
+
+                dsn = Connection.__dsn or local_settings.PG_PARAMS
+                maxconn = (Connection.__maxconn or
+                           getattr(local_settings, 'PG_POOL_SIZE',
+                                   Connection.MAX_CONNECTIONS))
+
+                pool = Pool(dsn, maxconn, connect=Connection.__connect)
+                Connection.__pool = pool
+
+        return pool
+
+    @staticmethod
+    def set_tracer(tracer):
+
+        """ Passa a registrar os comandos executados no objeto
+            profiling.Tracer 'tracer'. None desativa o registro.
+        """
+
+        Connection.__tracer = tracer
+
+    @staticmethod
+    def tracer():
+        return Connection.__tracer
+
+    @staticmethod
+    def __cursor(conn, name=None, itersize=None, origin=None):
+        cursor = conn.cursor(name)
+
+        if itersize is not None:
+            cursor.itersize = itersize
+
+        if Connection.__tracer is not None:
+            cursor = Connection.__tracer.wrap(cursor, origin)
+
+        return cursor
+
+    @staticmethod
+    @contextmanager
+    def connection():
+
+        """ Obtém uma conexão do pool, devolvendo-a ao fim
+            do bloco 'with'.
+        """
+
+        pool = Connection.pool()
+        conn = pool.get()
+
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
 
     @staticmethod
     def query(query, qargs=None):
-        cursor = Connection.__connection.cursor()
-        cursor.execute(query, qargs)
-        data = cursor.fetchall()
-        cursor.close()
+        with Connection.connection() as conn:
+            cursor = Connection.__cursor(conn)
+            cursor.execute(query, qargs)
+            data = cursor.fetchall()
+            cursor.close()
 
         return data
 
+    @staticmethod
+    def stream(query, qargs=None, itersize=None, origin=None):
+
+        """ Executa a consulta em um cursor do servidor (named cursor) e
+            retorna um gerador com as suas linhas, trazidas do servidor
+            'itersize' por vez (padrão: Connection.ITERSIZE). A conexão
+            fica reservada até o gerador ser consumido ou descartado.
+            'origin' é a origem registrada pelo tracer (ver set_tracer).
+        """
+
+        with Connection.connection() as conn:
+            # Cursores do servidor só existem dentro de uma transação
+            conn.autocommit = False
+            cursor = Connection.__cursor(
+                conn, "docgen_stream_%d" % next(Connection.__names),
+                itersize or Connection.ITERSIZE, origin)
+
+            try:
+                cursor.execute(query, qargs)
+                for row in cursor:
+                    yield row
+            finally:
+                # Um erro ao fechar o cursor (ex: conexão perdida) não
+                # impede o rollback nem esconde a exceção original
+                try:
+                    cursor.close()
+                except psycopg2.Error:
+                    pass
+
+                try:
+                    conn.rollback()
+                    conn.autocommit = True
+                except psycopg2.Error:
+                    # Conexões fechadas são descartadas pelo pool
+                    conn.close()
+
     @staticmethod
     def execute(statement, qargs=None):
-        cursor = Connection.__connection.cursor()
-        cursor.execute(statement, qargs)
-        cursor.close()
-        Connection.__connection.commit()
+        with Connection.connection() as conn:
+            cursor = Connection.__cursor(conn)
+            cursor.execute(statement, qargs)
+            cursor.close()
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+
+        """ Abre uma transação e retorna um cursor para ela.
+            A transação é confirmada ao fim do bloco 'with' ou
+            desfeita caso ocorra alguma exceção.
+        """
+
+        with Connection.connection() as conn:
+            conn.autocommit = False
+            cursor = Connection.__cursor(conn)
+
+            try:
+                yield cursor
+                conn.commit()
+            except:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                if not conn.closed:
+                    cursor.close()
+                    conn.autocommit = True
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import traceback
+
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+import templating
+from connection import Connection
+
+# Bancos de dados de um cluster que podem ser documentados
+DATABASES_QUERY = (
+    "SELECT datname FROM pg_catalog.pg_database "
+    "WHERE datallowconn AND NOT datistemplate ORDER BY datname")
+
+# Número padrão de bancos de dados processados ao mesmo tempo
+# em um mesmo servidor
+PER_HOST = 2
+
+# Semáforos de cada servidor, criados antes dos processos
+# para que sejam herdados por eles (ver generate)
+__semaphores = {}
+
+
+def discover(dsn):
+
+    """ Retorna os DSNs de todos os bancos de dados do cluster
+        ao qual 'dsn' se conecta.
+    """
+
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(DATABASES_QUERY)
+        names = [r[0] for r in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    return [make_dsn(dsn, dbname=name) for name in names]
+
+
+def configured():
+
+    """ Retorna os DSNs dos bancos de dados indicados em local_settings:
+        os de PG_DATABASES e todos os dos clusters de PG_CLUSTERS.
+        Caso nenhum dos dois exista, todos os bancos de dados do
+        cluster de PG_PARAMS.
+
+        Um banco de dados indicado mais de uma vez (mesmo servidor e
+        nome, ainda que com DSNs escritos de outra forma) aparece uma
+        única vez, com o primeiro DSN encontrado.
+    """
+
+    import local_settings
+
+    databases = list(getattr(local_settings, 'PG_DATABASES', []))
+    clusters = list(getattr(local_settings, 'PG_CLUSTERS', []))
+
+    if not databases and not clusters:
+        clusters = [local_settings.PG_PARAMS]
+
+    for cluster in clusters:
+        databases.extend(discover(cluster))
+
+    unique = []
+    seen = set()
+    for dsn in databases:
+        key = (host(dsn), dbname(dsn))
+        if key not in seen:
+            seen.add(key)
+            unique.append(dsn)
+
+    return unique
+
+
+def host(dsn):
+
+    """ Servidor ('host:porta') de um DSN """
+
+    params = parse_dsn(dsn)
+    return "{0}:{1}".format(params.get('host', 'localhost'),
+                            params.get('port', '5432'))
+
+
+def dbname(dsn):
+
+    """ Nome do banco de dados de um DSN (o do usuário, caso omitido) """
+
+    params = parse_dsn(dsn)
+    return params.get('dbname') or params.get('user')
+
+
+def output_dir(path, dsn, by_host=False):
+
+    """ Pasta dentro de 'path' com os arquivos do banco de dados 'dsn'.
+        Com 'by_host', os bancos de dados ficam separados por servidor.
+    """
+
+    if by_host:
+        return os.path.join(path, host(dsn).replace(":", "_"), dbname(dsn))
+
+    return os.path.join(path, dbname(dsn))
+
+
+def __interleave(tasks):
+
+    """ Ordena as tarefas alternando entre os servidores, para que os
+        processos não fiquem todos esperando pelo mesmo servidor.
+    """
+
+    by_host = {}
+    for task in tasks:
+        by_host.setdefault(host(task[2]), []).append(task)
+
+    queues = [by_host[h] for h in sorted(by_host)]
+    ordered = []
+    while queues:
+        ordered.extend(q.pop(0) for q in queues)
+        queues = [q for q in queues if q]
+
+    return ordered
+
+
+def __generate(args):
+
+    """ Gera os arquivos de um banco de dados, respeitando o limite
+        de processos do seu servidor. Retorna (dsn, erro ou None).
+    """
+
+    func, path, dsn, force = args
+
+    with __semaphores[host(dsn)]:
+        try:
+            Connection.configure(dsn)
+
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+            func(path, 1, force)
+            return dsn, None
+        except Exception:
+            return dsn, traceback.format_exc()
+
+
+def generate(func, path, dsns, jobs=None, per_host=PER_HOST, force=False,
+             variant='text'):
+
+    """ Gera os arquivos de todos os bancos de dados em 'dsns' chamando
+        func(pasta, 1, force) (ex: doc.doc_all), cada um em sua pasta
+        dentro de 'path' (ver output_dir).
+
+        Os bancos de dados são divididos entre 'jobs' processos (padrão:
+        'per_host' por servidor), com no máximo 'per_host' deles sendo
+        processados ao mesmo tempo em um mesmo servidor. Os templates
+        da variante 'variant' usada por 'func' ('text', 'html' ou None,
+        caso não use templates) são compilados uma única vez, antes da
+        criação dos processos.
+    """
+
+    if variant is not None:
+        templating.preload(variant)
+
+    hosts = set(host(dsn) for dsn in dsns)
+    tasks = __interleave([(func, output_dir(path, dsn, len(hosts) > 1), dsn,
+                           force)
+                          for dsn in dsns])
+
+    if jobs is None:
+        jobs = per_host * len(hosts)
+
+    __semaphores.clear()
+    for dsn in dsns:
+        __semaphores.setdefault(host(dsn),
+                                multiprocessing.BoundedSemaphore(per_host))
+
+    pool = multiprocessing.Pool(max(1, min(jobs, len(tasks))))
+
+    try:
+        results = pool.map(__generate, tasks, chunksize=1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    failed = 0
+    for dsn, error in results:
+        if error is not None:
+            failed += 1
+            print "Erro em '%s':\n%s" % (dsn, error)
+
+    print "%d banco(s) de dados processado(s), %d com erro." % (
+        len(results) - failed, failed)
+
+    return failed
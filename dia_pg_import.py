@@ -41,6 +41,9 @@ class Schema(object):
         self.name = name
         self.__tables = None
         self.__views = None
+        self.__keys = None
+        self.__columns = None
+        self.__references = None
 
     @classmethod
     def with_name(cls, name):
@@ -73,6 +76,42 @@ class Schema(object):
 
         return self.__views
 
+    @property
+    def keys(self):
+
+        if self.__keys is None:
+            self.__keys = Keys.all(schema=self)
+
+        return self.__keys
+
+    @property
+    def columns(self):
+
+        if self.__columns is None:
+            self.__columns = Columns.all(schema=self)
+
+        return self.__columns
+
+    @property
+    def references(self):
+
+        # Pares (tabela, tabela referenciada) das chaves estrangeiras
+        # entre tabelas do schema, lidos com uma única consulta
+
+        if self.__references is None:
+            self.__references = Connection.query(
+                """ SELECT DISTINCT c.relname, f.relname
+                    FROM pg_catalog.pg_constraint r
+                    JOIN pg_catalog.pg_class c ON c.oid = r.conrelid
+                    JOIN pg_catalog.pg_class f ON f.oid = r.confrelid
+                    JOIN pg_catalog.pg_namespace ns
+                    ON ns.oid = c.relnamespace
+                    WHERE ns.nspname = %s AND r.contype = 'f'
+                    AND f.relnamespace = c.relnamespace
+                """, (self.name,))
+
+        return self.__references
+
     def __unicode__(self):
         return self.name
 
@@ -93,7 +132,7 @@ class Relation(object):
     def columns(self):
 
         if self.__columns is None:
-            self.__columns = Column.all(self.schema, self)
+            self.__columns = self.schema.columns.of(self)
 
         return self.__columns
 
@@ -131,7 +170,6 @@ class Table(Relation):
 
     def __init__(self, schema, name):
         super(Table, self).__init__(schema, name)
-        self.__constraints = None
         self.__indexes = None
 
     @classmethod
@@ -146,33 +184,80 @@ class Table(Relation):
         )
         return [Table(schema=schema, name=r[0]) for r in data]
 
-    @property
-    def constraints(self):
-        if self.__constraints is None:
-            self.__constraints = Constraint.all(self.schema, self)
+    def column_keys(self, column):
+        return self.schema.keys.of(self.name, column)
 
-        return self.__constraints
 
-    def has_constraint(self, definition):
-        return definition in self.constraints
+class Keys(object):
 
+    # Participação das colunas de todas as tabelas de um schema em
+    # chaves primárias e únicas, lida de pg_constraint.conkey com uma
+    # única consulta. Todas as colunas de uma chave primária composta
+    # fazem parte dela; uma coluna só é única quando a constraint UNIQUE
+    # tem somente ela.
 
-class Constraint(object):
+    PRIMARY = 'p'
+    UNIQUE = 'u'
 
-    def __init__(self, name, definition):
-        self.name = name
-        self.definition = definition
+    def __init__(self, data):
+        self.__columns = {}
+
+        for table, column, contype, size in data:
+            if contype == Keys.UNIQUE and size > 1:
+                continue
+
+            self.__columns.setdefault((table, column), set()).add(contype)
 
     @classmethod
-    def all(cls, schema, table):
+    def all(cls, schema):
         data = Connection.query(
-            """ SELECT conname,
-                pg_catalog.pg_get_constraintdef(r.oid, true) as condef
+            """ SELECT c.relname, a.attname, r.contype,
+                array_length(r.conkey, 1)
                 FROM pg_catalog.pg_constraint r
-                WHERE conrelid::regclass = (%s || '.' || %s)::regclass
-            """, (schema.name, table.name,))
+                JOIN pg_catalog.pg_class c ON c.oid = r.conrelid
+                JOIN pg_catalog.pg_namespace ns ON ns.oid = c.relnamespace
+                JOIN pg_catalog.pg_attribute a
+                ON a.attrelid = r.conrelid AND a.attnum = ANY(r.conkey)
+                WHERE ns.nspname = %s AND r.contype IN ('p', 'u')
+            """, (schema.name,))
+
+        return Keys(data)
+
+    def of(self, table, column):
+        return self.__columns.get((table, column), frozenset())
+
 
-        return [Constraint(name=reg[0], definition=reg[1]) for reg in data]
+class Columns(object):
+
+    # Colunas de todas as tabelas e views de um schema, lidas com uma
+    # única consulta e agrupadas pelo nome da relação, para que o tamanho
+    # de milhares de tabelas seja estimado sem uma consulta por tabela
+
+    def __init__(self, data):
+        self.__columns = {}
+
+        for r in data:
+            self.__columns.setdefault(r[0], []).append(r[1:])
+
+    @classmethod
+    def all(cls, schema):
+        data = Connection.query(
+            "SELECT table_name, column_name, is_nullable, data_type, "
+            "character_maximum_length, numeric_precision "
+            "FROM information_schema.columns "
+            "WHERE table_schema = %s "
+            "ORDER BY table_name, ordinal_position",
+
+            (schema.name,)
+        )
+
+        return Columns(data)
+
+    def of(self, table):
+        return [Column(schema=table.schema, table=table, name=r[0],
+                       is_nullable=r[1], data_type=r[2],
+                       character_maximum_length=r[3], numeric_precision=r[4])
+                for r in self.__columns.get(table.name, [])]
 
 
 class View(Relation):
@@ -202,23 +287,6 @@ class Column(object):
         self.__character_maximum_length = character_maximum_length
         self.__numeric_precision = numeric_precision
 
-    @classmethod
-    def all(cls, schema, table):
-
-        data = Connection.query(
-            "SELECT column_name as name, is_nullable, data_type, "
-            "character_maximum_length, numeric_precision "
-            "FROM information_schema.columns "
-            "WHERE table_schema=%s and table_name=%s",
-
-            (schema.name, table.name,)
-        )
-
-        return [Column(schema=schema, table=table, name=r[0], is_nullable=r[1],
-                       data_type=r[2], character_maximum_length=r[3],
-                       numeric_precision=r[4])
-                for r in data]
-
     @property
     def data_type(self):
 
@@ -241,16 +309,12 @@ class Column(object):
     @property
     def is_pk(self):
         return (isinstance(self.table, Table)
-                and self.table.has_constraint(
-                    'PRIMARY KEY ({0})'.format(self.name)
-                    )
-                )
+                and Keys.PRIMARY in self.table.column_keys(self.name))
 
     @property
     def is_unique(self):
         return (isinstance(self.table, Table)
-                and self.table.has_constraint('UNIQUE ({0})'.format(self.name))
-                )
+                and Keys.UNIQUE in self.table.column_keys(self.name))
 
     def __unicode__(self):
         return self.name
@@ -263,6 +327,214 @@ def attribute(name, ftype, pk=False, nullable=True, unique=False):
     return (name, ftype, '', int(pk), int(nullable), int(unique))
 
 
+# Tamanho aproximado de um caractere e de uma linha de uma tabela no
+# diagrama, usado para estimar o tamanho das tabelas antes de criá-las
+CHAR_WIDTH = 0.45
+LINE_HEIGHT = 0.8
+
+
+def estimated_size(rel):
+    chars = max([len(rel.name)] +
+                [len(c.name) + len(c.data_type) + 4 for c in rel.columns])
+
+    return chars * CHAR_WIDTH + 1, (len(rel.columns) + 2) * LINE_HEIGHT
+
+
+def _components(names, neighbors):
+
+    # Grupos de tabelas ligadas por chaves estrangeiras, na ordem de 'names'
+
+    seen = set()
+    components = []
+
+    for name in names:
+        if name in seen:
+            continue
+
+        seen.add(name)
+        component, stack = [], [name]
+        while stack:
+            node = stack.pop()
+            component.append(node)
+            for other in neighbors[node]:
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+
+        components.append(component)
+
+    return components
+
+
+def _layers(component, refs, referrers):
+
+    # Camada de cada tabela: as referenciadas ficam à esquerda de quem as
+    # referencia. Ciclos são quebrados ignorando as referências pendentes
+    # da primeira tabela que restar.
+
+    pending = dict((name, len(refs[name])) for name in component)
+    layer = dict((name, 0) for name in component)
+    ready = [name for name in component if not pending[name]]
+    done = set()
+    next_forced = 0
+
+    while len(done) < len(component):
+        if not ready:
+            while component[next_forced] in done:
+                next_forced += 1
+            ready.append(component[next_forced])
+
+        name = ready.pop()
+        if name in done:
+            continue
+        done.add(name)
+
+        for other in referrers[name]:
+            if other in done:
+                continue
+            layer[other] = max(layer[other], layer[name] + 1)
+            pending[other] -= 1
+            if not pending[other]:
+                ready.append(other)
+
+    layers = [[] for i in range(max(layer.values()) + 1)]
+    for name in component:
+        layers[layer[name]].append(name)
+
+    return layers
+
+
+def _order(layers, neighbors, sweeps=4):
+
+    # Ordena as tabelas de cada camada pela posição média dos seus
+    # vizinhos nas camadas adjacentes (heurística do baricentro),
+    # diminuindo o cruzamento das ligações
+
+    position = {}
+    for nodes in layers:
+        for i, name in enumerate(nodes):
+            position[name] = i
+
+    def barycenter(name, adjacent):
+        pos = [position[n] for n in neighbors[name] if n in adjacent]
+        if not pos:
+            return position[name]
+        return float(sum(pos)) / len(pos)
+
+    for sweep in range(sweeps):
+        if sweep % 2 == 0:
+            indexes = range(1, len(layers))
+            step = -1
+        else:
+            indexes = range(len(layers) - 2, -1, -1)
+            step = 1
+
+        for i in indexes:
+            adjacent = set(layers[i + step])
+            layers[i].sort(key=lambda n: barycenter(n, adjacent))
+            for j, name in enumerate(layers[i]):
+                position[name] = j
+
+    return layers
+
+
+def _place(layers, sizes, spacing, max_width, max_height):
+
+    # Posição de cada tabela dentro do grupo e o tamanho do grupo.
+    # Cada camada é uma coluna, dividida em várias caso fique mais alta que
+    # 'max_height'. As colunas que passariam de 'max_width' continuam
+    # abaixo das anteriores, em uma nova faixa, de forma que mesmo um
+    # grupo muito grande respeita a largura máxima.
+
+    # Colunas: (tabelas e suas posições y, largura, altura, espaço antes)
+    columns = []
+    for nodes in layers:
+        gap = spacing * 2
+        column, y, column_width = [], 0, 0
+        for name in nodes:
+            w, h = sizes[name]
+            if column and y + h > max_height:
+                columns.append((column, column_width, y - spacing, gap))
+                gap = spacing
+                column, y, column_width = [], 0, 0
+
+            column.append((name, y))
+            column_width = max(column_width, w)
+            y += h + spacing
+
+        if column:
+            columns.append((column, column_width, y - spacing, gap))
+
+    positions = {}
+    x, top, band_height, width = 0, 0, 0, 0
+
+    for column, column_width, column_height, gap in columns:
+        if x > 0:
+            if x + gap + column_width > max_width:
+                x, top = 0, top + band_height + spacing * 2
+                band_height = 0
+            else:
+                x += gap
+
+        for name, y in column:
+            positions[name] = (x, top + y)
+
+        x += column_width
+        width = max(width, x)
+        band_height = max(band_height, column_height)
+
+    return positions, width, top + band_height
+
+
+def layout(relations, references, spacing=3, max_width=100, max_height=60):
+
+    # Posição (x, y) de cada relação, indexada pelo nome.
+    # As tabelas ligadas por chaves estrangeiras ('references', pares
+    # (tabela, tabela referenciada)) formam grupos, organizados em camadas
+    # da esquerda para a direita, com colunas de até 'max_height' de
+    # altura. Os grupos são distribuídos em linhas de até 'max_width' de
+    # largura; um grupo mais largo continua em faixas abaixo (ver _place).
+    # Somente uma tabela mais larga que 'max_width' passa desse limite.
+    # Usa somente o tamanho estimado das relações, antes de criá-las no
+    # diagrama.
+
+    names = [rel.name for rel in relations]
+    sizes = dict((rel.name, estimated_size(rel)) for rel in relations)
+
+    refs = dict((name, set()) for name in names)
+    referrers = dict((name, set()) for name in names)
+    for table, referenced in references:
+        if table != referenced and table in refs and referenced in refs:
+            refs[table].add(referenced)
+            referrers[referenced].add(table)
+
+    neighbors = dict((name, refs[name] | referrers[name]) for name in names)
+
+    groups = []
+    for component in _components(names, neighbors):
+        layers = _order(_layers(component, refs, referrers), neighbors)
+        groups.append(_place(layers, sizes, spacing, max_width, max_height))
+
+    # Grupos maiores primeiro; a ordem das relações é mantida entre
+    # grupos do mesmo tamanho (ex: tabelas isoladas e views)
+    groups.sort(key=lambda g: -len(g[0]))
+
+    positions = {}
+    x, y, row_height = 0, 0, 0
+
+    for group, width, height in groups:
+        if x > 0 and x + width > max_width:
+            x, y, row_height = 0, y + row_height + spacing, 0
+
+        for name, (gx, gy) in group.items():
+            positions[name] = (x + gx, y + gy)
+
+        x += width + spacing
+        row_height = max(row_height, height)
+
+    return positions
+
+
 class PgImportDialog(object):
 
     def __init__(self, layer):
@@ -370,6 +642,7 @@ class PgImportDialog(object):
 
         SPACING = 3
         MAX_X = 100
+        MAX_Y = 60
 
         try:
             Connection.connect(host=self.host_entry.get_text(),
@@ -393,31 +666,18 @@ class PgImportDialog(object):
                     dia.message(2, "Table not found")
 
             else:
-                x, y, max_y = 0, 0, 0
+                relations = schema.tables + schema.views
+                positions = layout(relations, schema.references,
+                                   SPACING, MAX_X, MAX_Y)
 
                 for table in schema.tables:
-
-                    dia_table = self._add_table(table, x, y,
-                                                self.prefix_opt.get_active())
-
-                    x = dia_table.bounding_box.right + SPACING
-                    max_y = max(max_y, dia_table.bounding_box.bottom)
-
-                    if x > MAX_X:
-                        x = 0
-                        y = max_y + SPACING
+                    x, y = positions[table.name]
+                    self._add_table(table, x, y,
+                                    self.prefix_opt.get_active())
 
                 for view in schema.views:
-
-                    dia_table = self._add_view(view, x, y,
-                                               self.prefix_opt.get_active())
-
-                    x = dia_table.bounding_box.right + SPACING
-                    max_y = max(max_y, dia_table.bounding_box.bottom)
-
-                    if x > MAX_X:
-                        x = 0
-                        y = max_y + SPACING
+                    x, y = positions[view.name]
+                    self._add_view(view, x, y, self.prefix_opt.get_active())
 
         except Exception as e:
             import sys
@@ -1,43 +1,125 @@
 # -*- coding: utf-8 -*-
-from jinja2 import Environment, PackageLoader
+import hashlib
+import os
 
-from .models import Schema
+from . import catalog
+from . import incremental
+from . import templating
+from .snapshot import open_snapshot
+from .writer import Writer
 
-__env = Environment(loader=PackageLoader('docgen', 'templates'))
+# Página de cada schema na documentação dividida (doc_all com 'split')
+SPLIT_INDEX = 'index.md'
 
 
-def __create_doc(path, schema):
+def __create_doc(path, schema, writer):
 
     """ Cria a documentação em markdown de um objeto Schema na pasta 'path' """
 
-    template = __env.get_template('schema.md')
-    fo = open(path+"/"+schema.name+".md", "w")
-    fo.write(template.render(schema=schema).encode('utf-8'))
-    fo.close()
+    templating.render(writer, 'text', 'schema.md',
+                      path+"/"+schema.name+".md", schema=schema)
 
 
-def doc_schema(path, schema):
+def __create_split_doc(path, schema, writer):
+
+    """ Cria a documentação em markdown de um objeto Schema dividida em
+        arquivos: 'path'/schema/index.md, com a lista das tabelas e views,
+        e um arquivo para cada uma delas em 'path'/schema/relations
+        (ver templating.file_name).
+
+        Retorna a pasta das relações e os nomes dos seus arquivos, para
+        que os demais sejam removidos depois da gravação.
+    """
+
+    folder = os.path.join(path, schema.name)
+    relations = os.path.join(folder, templating.RELATIONS_DIR)
+
+    if not os.path.isdir(relations):
+        os.makedirs(relations)
+
+    templating.render(writer, 'text', 'schema_index.md',
+                      os.path.join(folder, SPLIT_INDEX), schema=schema)
+
+    for rel in schema.tables():
+        templating.render(writer, 'text', 'relation.md',
+                          os.path.join(relations,
+                                       templating.file_name(rel.name) + ".md"),
+                          schema=schema, rel=rel, is_table=True)
+
+    for rel in schema.views():
+        templating.render(writer, 'text', 'relation.md',
+                          os.path.join(relations,
+                                       templating.file_name(rel.name) + ".md"),
+                          schema=schema, rel=rel, is_table=False)
+
+    return relations, templating.relation_files(schema, ".md")
+
+
+def doc_schema(path, schema, snapshot=None, filter=None):
 
     """ Cria a documentação para um schema de nome 'schema' na pasta 'path' """
 
-    s = Schema.with_name(schema)
+    s = catalog.load_schema(schema, open_snapshot(snapshot), filter)
 
     if not s:
         print "Schema com nome '%s' não encontrado." % (schema,)
     else:
-        __create_doc(path, s)
+        with Writer() as writer:
+            __create_doc(path, s, writer)
+
+
+def __doc_schemas(args):
 
+    """ Cria na pasta 'path' as documentações dos schemas com os
+        nomes indicados. Executada pelos processos de doc_all.
+    """
+
+    path, snapshot, filter, names = args
+
+    with Writer() as writer:
+        for s in catalog.load(names, open_snapshot(snapshot), filter):
+            __create_doc(path, s, writer)
+
+
+def __doc_split_schemas(args):
+
+    """ Como __doc_schemas, mas com a documentação dividida
+        em um arquivo por relação
+    """
 
-def doc_all(path):
+    path, snapshot, filter, names = args
+
+    written = []
+    with Writer() as writer:
+        for s in catalog.load(names, open_snapshot(snapshot), filter):
+            written.append(__create_split_doc(path, s, writer))
+
+    # Somente depois que os novos arquivos foram gravados
+    for relations, files in written:
+        templating.remove_stale(relations, files)
+
+
+def doc_all(path, jobs=1, force=False, snapshot=None, split=False,
+            names=None, filter=None):
 
     """ Cria na pasta 'path' as documentações
-        para todos os schemas do banco de dados
+        para todos os schemas do banco de dados.
+
+        Com 'split', cada schema tem uma pasta com um arquivo por
+        tabela ou view e um índice. Ver incremental.generate para
+        'jobs', 'force', 'snapshot', 'names' e 'filter'.
+
+        Retorna os nomes dos schemas encontrados.
     """
 
-    schemas = Schema.all()
+    if split:
+        salt = hashlib.md5(templating.source('schema_index.md') +
+                           templating.source('relation.md')).hexdigest()
+        return incremental.generate(__doc_split_schemas, path,
+                                    "/" + SPLIT_INDEX, salt, jobs, force,
+                                    snapshot, names, filter)
 
-    if not schemas:
-        print "Nenhum schema encontrado."
+    salt = hashlib.md5(templating.source('schema.md')).hexdigest()
 
-    for s in schemas:
-        __create_doc(path, s)
+    return incremental.generate(__doc_schemas, path, ".md", salt, jobs,
+                                force, snapshot, names, filter)
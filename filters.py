@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import re
+
+# Prefixo dos padrões que são expressões regulares; os demais são globs
+REGEX_PREFIX = 're:'
+
+# Caracteres especiais das expressões regulares, escapados nos globs
+__SPECIAL = re.compile(r'([.^$+(){}\[\]|\\])')
+
+
+def __glob_class(pattern, start):
+
+    """ Converte a classe de caracteres do glob que começa em
+        'pattern[start]' ('[abc]', '[a-z]', '[!abc]'). Retorna a
+        expressão regular equivalente e a posição seguinte ao ']',
+        ou None caso a classe não seja fechada.
+    """
+
+    end = start + 1
+    if pattern[end:end + 1] == '!':
+        end += 1
+    # ']' logo após '[' ou '[!' faz parte da classe, como em fnmatch
+    if pattern[end:end + 1] == ']':
+        end += 1
+
+    end = pattern.find(']', end)
+    if end < 0:
+        return None
+
+    body = pattern[start + 1:end].replace('\\', '\\\\')
+    if body.startswith('!'):
+        body = '^' + body[1:]
+    elif body.startswith('^'):
+        body = '\\' + body
+
+    return '[' + body + ']', end + 1
+
+
+def to_regex(pattern):
+
+    """ Converte o padrão 'pattern' em uma expressão regular aceita pelo
+        PostgreSQL e pelo Python.
+
+        Padrões com o prefixo 're:' já são expressões regulares e
+        procuram o texto em qualquer parte do nome, como o operador ~.
+        Os demais são globs, com '*', '?' e classes como '[a-z]' ou
+        '[!0-9]', e devem casar com o nome inteiro.
+        Ex: 'tenant_*' -> '^tenant_.*$'
+    """
+
+    if pattern.startswith(REGEX_PREFIX):
+        return pattern[len(REGEX_PREFIX):]
+
+    regex = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        converted = c == '[' and __glob_class(pattern, i)
+
+        if converted:
+            part, i = converted
+            regex.append(part)
+            continue
+
+        if c == '*':
+            regex.append('.*')
+        elif c == '?':
+            regex.append('.')
+        else:
+            regex.append(__SPECIAL.sub(r'\\\1', c))
+        i += 1
+
+    return '^' + ''.join(regex) + '$'
+
+
+class Filter(object):
+
+    """ Padrões de inclusão e exclusão dos schemas e das relações
+        (tabelas e views) a documentar.
+
+        Um nome é aceito quando casa com algum padrão de inclusão (ou
+        não há nenhum) e com nenhum de exclusão. As condições são
+        aplicadas nas próprias consultas ao catálogo (ver condition),
+        de forma que os objetos excluídos nem chegam a ser lidos.
+    """
+
+    def __init__(self, include_schemas=(), exclude_schemas=(),
+                 include_relations=(), exclude_relations=()):
+
+        """ Os padrões são globs ou expressões regulares (ver to_regex) """
+
+        self.include_schemas = [to_regex(p) for p in include_schemas]
+        self.exclude_schemas = [to_regex(p) for p in exclude_schemas]
+        self.include_relations = [to_regex(p) for p in include_relations]
+        self.exclude_relations = [to_regex(p) for p in exclude_relations]
+
+        for regex in (self.include_schemas + self.exclude_schemas +
+                      self.include_relations + self.exclude_relations):
+            try:
+                re.compile(regex, re.UNICODE)
+            except re.error, e:
+                raise ValueError(
+                    u"Padrão '{0}' inválido: {1}".format(regex, e))
+
+    def __condition(self, column, include, exclude):
+        sql = ""
+        qargs = []
+
+        if include:
+            sql += "AND {0} ~ ANY(%s) ".format(column)
+            qargs.append(include)
+
+        if exclude:
+            sql += "AND NOT ({0} ~ ANY(%s)) ".format(column)
+            qargs.append(exclude)
+
+        return sql, qargs
+
+    def condition(self, kind, column):
+
+        """ Retorna o trecho do WHERE que restringe a coluna 'column' aos
+            nomes aceitos e os seus argumentos. 'kind' é 'schemas' ou
+            'relations'. Vazio caso não haja padrões desse tipo.
+        """
+
+        if kind == 'schemas':
+            return self.__condition(column, self.include_schemas,
+                                    self.exclude_schemas)
+
+        return self.__condition(column, self.include_relations,
+                                self.exclude_relations)
+
+    def __matches(self, name, include, exclude):
+        if include and not any(re.search(r, name, re.UNICODE)
+                               for r in include):
+            return False
+
+        return not any(re.search(r, name, re.UNICODE) for r in exclude)
+
+    def schema_matches(self, name):
+
+        """ Verifica se o schema de nome 'name' é aceito """
+
+        return self.__matches(name, self.include_schemas,
+                              self.exclude_schemas)
+
+    def relation_matches(self, name):
+
+        """ Verifica se a relação de nome 'name' é aceita """
+
+        return self.__matches(name, self.include_relations,
+                              self.exclude_relations)
+
+    def key(self):
+
+        """ Impressão digital dos padrões, combinada às dos schemas (ver
+            incremental.generate) para que uma mudança nos padrões gere
+            os arquivos novamente. Vazia caso não haja nenhum padrão.
+        """
+
+        patterns = [self.include_schemas, self.exclude_schemas,
+                    self.include_relations, self.exclude_relations]
+
+        if not any(patterns):
+            return ""
+
+        return hashlib.md5(json.dumps(patterns)).hexdigest()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+
+from . import catalog
+from . import incremental
+from . import templating
+from .snapshot import open_snapshot
+from .writer import Writer
+
+# Arquivos copiados sem alteração para a pasta do site
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'static')
+STATIC_FILES = ('search.js',)
+
+TEMPLATES = ('html/base.html', 'html/index.html', 'html/schema.html',
+             'html/relation.html')
+
+# Índice de busca do site e a parte de cada schema, guardada na pasta
+# do schema para que o índice seja montado sem gerar os demais schemas
+SEARCH_INDEX = 'search-index.json'
+SCHEMA_INDEX = 'search.json'
+
+# Página de cada schema, relativa à pasta do site
+SCHEMA_PAGE = '/index.html'
+
+
+def __json(data):
+
+    """ 'data' em JSON compacto, codificado em UTF-8. Os caracteres
+        acentuados são mantidos, em vez de escapados como \\uXXXX.
+    """
+
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(",", ":")).encode('utf-8')
+
+
+def search_entries(schema):
+
+    """ Entradas do índice de busca de um objeto Schema:
+        [tipo, relação, nome, descrição] do schema, das tabelas, views,
+        colunas e índices, com tipo 's', 't', 'v', 'c' ou 'i'.
+    """
+
+    entries = [["s", "", "", schema.description or ""]]
+
+    for kind, relations in (("t", schema.tables()), ("v", schema.views())):
+        for rel in relations:
+            entries.append([kind, rel.name, "", rel.description or ""])
+
+            for column in rel.columns():
+                entries.append(["c", rel.name, column.name,
+                                column.description or ""])
+
+            if kind == "t":
+                for idx in rel.indexes():
+                    entries.append(["i", rel.name, idx.name, ""])
+
+    return entries
+
+
+def __create_site(path, schema, writer):
+
+    """ Cria a pasta do schema no site 'path', com uma página para o
+        schema, uma para cada relação (na pasta 'relations', ver
+        templating.file_name) e a sua parte do índice de busca
+
+        Retorna a pasta das relações e os nomes das suas páginas, para
+        que as demais sejam removidas depois da gravação.
+    """
+
+    folder = os.path.join(path, schema.name)
+    relations = os.path.join(folder, templating.RELATIONS_DIR)
+
+    if not os.path.isdir(relations):
+        os.makedirs(relations)
+
+    templating.render(writer, 'html', 'html/schema.html',
+                      os.path.join(folder, 'index.html'), schema=schema,
+                      root="../")
+
+    for rel in schema.tables():
+        templating.render(writer, 'html', 'html/relation.html',
+                          os.path.join(relations,
+                                       templating.file_name(rel.name) +
+                                       ".html"),
+                          schema=schema, rel=rel, kind=u"Tabela",
+                          is_table=True, root="../../")
+
+    for rel in schema.views():
+        templating.render(writer, 'html', 'html/relation.html',
+                          os.path.join(relations,
+                                       templating.file_name(rel.name) +
+                                       ".html"),
+                          schema=schema, rel=rel, kind=u"View",
+                          is_table=False, root="../../")
+
+    with writer.open(os.path.join(folder, SCHEMA_INDEX)) as fo:
+        fo.write(__json(search_entries(schema)))
+
+    return relations, templating.relation_files(schema, ".html")
+
+
+def __html_schemas(args):
+
+    """ Cria no site 'path' as pastas dos schemas com os nomes
+        indicados. Executada pelos processos de html_all.
+    """
+
+    path, snapshot, filter, names = args
+
+    written = []
+    with Writer() as writer:
+        for s in catalog.load(names, open_snapshot(snapshot), filter):
+            written.append(__create_site(path, s, writer))
+
+    # Somente depois que as novas páginas foram gravadas
+    for relations, files in written:
+        templating.remove_stale(relations, files)
+
+
+def __create_index(path, names):
+
+    """ Junta as partes do índice de busca dos schemas 'names' no
+        índice do site e cria a página inicial
+    """
+
+    schemas = []
+    entries = []
+
+    for i, name in enumerate(names):
+        with open(os.path.join(path, name, SCHEMA_INDEX)) as fo:
+            schema_entries = json.load(fo)
+
+        schemas.append((name, schema_entries[0][3]))
+        entries.extend([e[0], i] + e[1:] for e in schema_entries)
+
+    tmp = os.path.join(path, SEARCH_INDEX + ".tmp")
+    with open(tmp, "wb") as fo:
+        fo.write(__json({"version": 1, "schemas": names,
+                         "entries": entries}))
+    os.rename(tmp, os.path.join(path, SEARCH_INDEX))
+
+    for fname in STATIC_FILES:
+        shutil.copy(os.path.join(STATIC_DIR, fname), path)
+
+    with Writer(threads=1) as writer:
+        templating.render(writer, 'html', 'html/index.html',
+                          os.path.join(path, 'index.html'), schemas=schemas,
+                          root="")
+
+
+def __salt():
+
+    """ Impressão digital dos templates e arquivos do site, para que
+        uma mudança neles gere todas as páginas novamente
+    """
+
+    md5 = hashlib.md5()
+
+    for name in TEMPLATES:
+        md5.update(templating.source(name))
+
+    for fname in STATIC_FILES:
+        with open(os.path.join(STATIC_DIR, fname)) as fo:
+            md5.update(fo.read())
+
+    return md5.hexdigest()
+
+
+def html_all(path, jobs=1, force=False, snapshot=None, filter=None):
+
+    """ Cria na pasta 'path' um site estático com a documentação de todos
+        os schemas do banco de dados: uma pasta por schema, com uma
+        página para o schema e uma para cada tabela e view, e um índice
+        de busca (search-index.json) usado pela página inicial.
+
+        Ver incremental.generate para 'jobs', 'force', 'snapshot'
+        e 'filter'.
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    names = incremental.generate(__html_schemas, path, SCHEMA_PAGE,
+                                 __salt(), jobs, force, snapshot,
+                                 filter=filter)
+
+    __create_index(path, names)
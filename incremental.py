@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+
+import catalog
+import workers
+from snapshot import open_snapshot
+
+
+class Manifest(object):
+
+    """ Impressões digitais dos schemas usadas na última geração dos
+        arquivos de uma pasta. Fica salvo junto aos arquivos gerados,
+        em '.docgen-fingerprints'.
+    """
+
+    FILENAME = ".docgen-fingerprints"
+
+    def __init__(self, path, ext, salt=""):
+
+        """ 'ext' é a extensão dos arquivos gerados ('.md', '.yaml').
+            'salt' é combinado às impressões digitais, para que uma
+            mudança no formato gerado (ex: no template) invalide os
+            arquivos existentes.
+        """
+
+        self.path = path
+        self.ext = ext
+        self.salt = salt
+        self.fname = os.path.join(path, Manifest.FILENAME)
+
+        try:
+            with open(self.fname) as fo:
+                self.__data = json.load(fo)
+        except (IOError, ValueError):
+            self.__data = {}
+
+        self.__entries = self.__data.setdefault(ext, {})
+
+    def __key(self, fingerprint):
+        return hashlib.md5(self.salt + fingerprint).hexdigest()
+
+    def outdated(self, fingerprints):
+
+        """ Retorna os nomes dos schemas cujos arquivos não existem
+            ou foram gerados a partir de outro estado do catálogo
+        """
+
+        return [name for name, fingerprint in sorted(fingerprints.items())
+                if self.__entries.get(name) != self.__key(fingerprint)
+                or not os.path.isfile(os.path.join(self.path,
+                                                   name + self.ext))]
+
+    def save(self, fingerprints, names=None):
+
+        """ Salva as impressões digitais dos arquivos gerados.
+
+            Com 'names', somente os schemas indicados são atualizados
+            (ou removidos, caso não estejam em 'fingerprints') e os
+            demais são mantidos.
+        """
+
+        entries = dict((name, self.__key(fingerprint))
+                       for name, fingerprint in fingerprints.items())
+
+        if names is not None:
+            for name in names:
+                self.__entries.pop(name, None)
+            self.__entries.update(entries)
+            entries = self.__entries
+
+        self.__data[self.ext] = self.__entries = entries
+
+        tmp = self.fname + ".tmp"
+        with open(tmp, "w") as fo:
+            json.dump(self.__data, fo, indent=1, sort_keys=True,
+                      separators=(",", ": "))
+        os.rename(tmp, self.fname)
+
+
+def generate(func, path, ext, salt="", jobs=1, force=False, snapshot=None,
+             names=None, filter=None):
+
+    """ Gera na pasta 'path' os arquivos de todos os schemas chamando
+        func((path, snapshot, filter, nomes)), mas somente para os schemas cujo
+        catálogo mudou desde a última geração. Com 'force', gera todos.
+        Usada por doc_all, all_yamls e html_all.
+
+        Com 'jobs' maior que 1, os schemas são divididos
+        entre 'jobs' processos. 'snapshot' é o nome do arquivo de
+        snapshot de onde o catálogo é lido, ou None.
+
+        'names' limita a geração aos schemas indicados, mantendo os
+        demais no manifesto. 'filter' (um objeto filters.Filter) limita
+        a geração aos schemas e relações aceitos; uma mudança nos seus
+        padrões gera todos os arquivos novamente.
+
+        Retorna os nomes de todos os schemas encontrados, gerados ou não.
+    """
+
+    fingerprints = catalog.fingerprints(names, open_snapshot(snapshot),
+                                        filter)
+
+    if not fingerprints and names is None:
+        print "Nenhum schema encontrado."
+        return []
+
+    if filter is not None:
+        salt += filter.key()
+
+    manifest = Manifest(path, ext, salt)
+
+    if force:
+        outdated = sorted(fingerprints)
+    else:
+        outdated = manifest.outdated(fingerprints)
+
+    skipped = len(fingerprints) - len(outdated)
+    if skipped:
+        print "%d schema(s) sem alterações." % (skipped,)
+
+    if jobs > 1 and len(outdated) > 1:
+        workers.run(func, outdated, jobs, path, snapshot, filter)
+    elif outdated:
+        func((path, snapshot, filter, outdated))
+
+    manifest.save(fingerprints, names)
+
+    return sorted(fingerprints)
@@ -4,12 +4,15 @@ import warnings
 from exceptions import RuntimeWarning
 
 from connection import Connection
+from comments import Comment, CommentWriter
 
 
 class Schema(object):
 
     """Representa um Schema no banco de dados"""
 
+    __slots__ = ('name', 'description', '__tables', '__views')
+
     def __init__(self, name, description):
         self.name = name
         self.description = description
@@ -113,6 +116,22 @@ class Schema(object):
     def set_views(self, views):
         self.__views = views
 
+    def comments(self):
+
+        """ Retorna as descrições (objetos Comment) do schema
+            e de suas tabelas e views
+        """
+
+        yield Comment(Comment.SCHEMA, (self.name,), self.description)
+
+        for table in self.tables():
+            for comment in table.comments():
+                yield comment
+
+        for view in self.views():
+            for comment in view.comments():
+                yield comment
+
     def sync_description(self):
 
         """ Salva a descrição do schema e de suas tabelas e views
@@ -120,19 +139,7 @@ class Schema(object):
         """
 
         try:
-            if self.description is not None:
-                Connection.execute(
-                    u"""COMMENT ON SCHEMA {0} IS %s""".format(self.name,),
-                    (self.description,))
-            else:
-                Connection.execute(
-                    u"""COMMENT ON SCHEMA {0} IS NULL""".format(self.name,))
-
-            for table in self.tables():
-                table.sync_description()
-
-            for view in self.views():
-                view.sync_description()
+            CommentWriter().apply(self.comments())
 
         except Exception, e:
             warnings.warn(
@@ -147,6 +154,8 @@ class Relation(object):
 
     __metaclass__ = ABCMeta
 
+    __slots__ = ('schema', 'name', 'description', '__columns')
+
     def __init__(self, schema, name, description):
         self.schema = schema
         self.name = name
@@ -186,12 +195,37 @@ class Relation(object):
         return dic
 
     @abstractmethod
+    def comment(self):
+        """ Retorna a descrição (objeto Comment) da relação """
+
+        raise NotImplementedError("Método não implementado na classe base.")
+
+    def comments(self):
+
+        """ Retorna a descrição da relação e, caso ela tenha uma,
+            as descrições de suas colunas
+        """
+
+        yield self.comment()
+
+        if self.description is not None:
+            for col in self.columns():
+                yield col.comment()
+
     def sync_description(self):
+
         """ Salva a descrição da relação e de suas colunas
-            (caso seja uma tabela) no banco de dados
+            no banco de dados
         """
 
-        raise NotImplementedError("Método não implementado na classe base.")
+        try:
+            CommentWriter().apply(self.comments())
+
+        except Exception, e:
+            warnings.warn(
+                "Erro ao sincronizar a relação {0}.{1}: {2}"
+                .format(self.schema, self.name, e),
+                RuntimeWarning)
 
     @classmethod
     @abstractmethod
@@ -207,6 +241,8 @@ class Table(Relation):
 
     """ Representa uma tabela no banco de dados """
 
+    __slots__ = ('__constraints', '__indexes')
+
     def __init__(self, schema, name, description):
         super(Table, self).__init__(schema, name, description)
         self.__constraints = None
@@ -230,29 +266,9 @@ class Table(Relation):
         return [Table(schema=schema, name=r[0], description=r[1])
                 for r in data]
 
-    def sync_description(self):
-        try:
-            if self.description is not None:
-                Connection.execute(
-                    u"""COMMENT ON TABLE "{0}"."{1}" IS %s"""
-                    .format(self.schema, self.name,),
-
-                    (self.description,)
-                )
-
-                for col in self.columns():
-                    col.sync_description()
-            else:
-                Connection.execute(
-                    u"""COMMENT ON TABLE "{0}"."{1}" IS NULL"""
-                    .format(self.schema, self.name,)
-                )
-
-        except Exception, e:
-            warnings.warn(
-                "Erro ao sincronizar a tabela {0}.{1}: {2}"
-                .format(self.schema, self.name, e),
-                RuntimeWarning)
+    def comment(self):
+        return Comment(Comment.TABLE, (self.schema, self.name),
+                       self.description)
 
     @classmethod
     def from_dic(cls, dic, schema):
@@ -282,8 +298,16 @@ class Table(Relation):
 
         return self.__indexes
 
+    def set_constraints(self, constraints):
+        self.__constraints = constraints
+
+    def set_indexes(self, indexes):
+        self.__indexes = indexes
+
 
 class Index(object):
+    __slots__ = ('name', 'itype', 'fields')
+
     def __init__(self, name, itype, fields):
         self.name = name
         self.itype = itype
@@ -313,6 +337,8 @@ class Index(object):
 
 
 class Constraint(object):
+    __slots__ = ('name', 'definition')
+
     def __init__(self, name, definition):
         self.name = name
         self.definition = definition
@@ -336,6 +362,8 @@ class View(Relation):
 
     """ Representa uma view no banco de dados """
 
+    __slots__ = ()
+
     @classmethod
     def all(cls, schema):
 
@@ -356,29 +384,9 @@ class View(Relation):
 
         return [View(schema=schema, name=r[0], description=r[1]) for r in data]
 
-    def sync_description(self):
-        try:
-            if self.description is not None:
-                Connection.execute(
-                    u"""COMMENT ON VIEW "{0}"."{1}" IS %s"""
-                    .format(self.schema, self.name,),
-
-                    (self.description,)
-                )
-
-                for col in self.columns():
-                    col.sync_description()
-            else:
-                Connection.execute(
-                    u"""COMMENT ON VIEW "{0}"."{1}" IS NULL"""
-                    .format(self.schema, self.name,)
-                )
-
-        except Exception, e:
-            warnings.warn(
-                "Erro ao sincronizar a view {0}.{1}: {2}"
-                .format(self.schema, self.name, e),
-                RuntimeWarning)
+    def comment(self):
+        return Comment(Comment.VIEW, (self.schema, self.name),
+                       self.description)
 
     @classmethod
     def from_dic(cls, dic, schema):
@@ -401,6 +409,10 @@ class Column(object):
 
     """ Representa uma coluna de uma tabela no banco de dados """
 
+    __slots__ = ('schema', 'table', 'name', 'description', 'default',
+                 'is_nullable', 'data_type', 'character_maximum_length',
+                 'numeric_precision')
+
     def __init__(self, schema, table, name, data_type="", description=u"",
                  default=None, is_nullable=True, character_maximum_length=None,
                  numeric_precision=None):
@@ -481,24 +493,19 @@ class Column(object):
                        character_maximum_length=r[5], numeric_precision=r[6])
                 for r in data]
 
+    def comment(self):
+
+        """ Retorna a descrição (objeto Comment) da coluna """
+
+        return Comment(Comment.COLUMN, (self.schema, self.table, self.name),
+                       self.description)
+
     def sync_description(self):
 
         """ Salva a descrição da coluna no banco de dados """
 
         try:
-            if self.description is not None:
-                Connection.execute(
-                    u"""COMMENT ON COLUMN "{0}"."{1}"."{2}" IS %s"""
-                    .format(self.schema, self.table, self.name,),
-
-                    (self.description,)
-                )
-
-            else:
-                Connection.execute(
-                    u"""COMMENT ON COLUMN "{0}"."{1}"."{2}" IS NULL"""
-                    .format(self.schema, self.table, self.name,)
-                )
+            CommentWriter().apply([self.comment()])
 
         except Exception, e:
             warnings.warn(
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import os
+import re
+import sys
+import time
+
+# Arquivos e funções que não são considerados como origem dos comandos
+__SKIP_FILES = ("connection.py", "profiling.py", "contextlib.py")
+__SKIP_FUNCTIONS = (("catalog.py", "fetch"), ("catalog.py", "__query"),
+                    ("catalog.py", "__init__"), ("catalog.py", "__fetch_all"),
+                    ("catalog.py", "__assemble"), ("catalog.py", "load"),
+                    ("catalog.py", "load_schema"))
+
+__LITERAL = re.compile(r"'(?:[^']|'')*'")
+__IDENTIFIER = re.compile(r'"(?:[^"]|"")*"')
+__NUMBER = re.compile(r"\b\d+\b")
+__SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+
+    """ Forma normalizada de um comando, sem literais, números e
+        identificadores entre aspas. Comandos repetidos de um lote
+        (ex: vários COMMENT ON) aparecem uma única vez.
+    """
+
+    if isinstance(statement, str):
+        statement = statement.decode('utf-8', 'replace')
+
+    statement = __LITERAL.sub(u"?", statement)
+    statement = __IDENTIFIER.sub(u"?", statement)
+    statement = __NUMBER.sub(u"?", statement)
+    statement = __SPACES.sub(u" ", statement).strip()
+
+    parts = []
+    for part in statement.split(u";"):
+        part = part.strip()
+        if part and part not in parts:
+            parts.append(part)
+
+    return u"; ".join(parts)
+
+
+def caller():
+
+    """ Função (ou método, ex: 'Table.all') que originou o comando """
+
+    frame = sys._getframe(1)
+
+    while frame is not None:
+        fname = os.path.basename(frame.f_code.co_filename)
+        if (not fname.startswith(__SKIP_FILES) and
+                (fname, frame.f_code.co_name) not in __SKIP_FUNCTIONS):
+            break
+        frame = frame.f_back
+
+    if frame is None:
+        return u"?"
+
+    name = frame.f_code.co_name
+    owner = frame.f_locals.get("self", frame.f_locals.get("cls"))
+
+    if owner is not None:
+        if not isinstance(owner, type):
+            owner = type(owner)
+        return u"{0}.{1}".format(owner.__name__, name)
+
+    return u"{0}.{1}".format(os.path.splitext(fname)[0], name)
+
+
+class TracedCursor(object):
+
+    """ Cursor que registra no Tracer os comandos que executa.
+
+        Em um cursor do servidor (named cursor), execute() somente
+        declara o cursor e as linhas são trazidas ao percorrê-lo. O
+        comando é registrado ao fim da leitura, com o tempo gasto
+        nas duas etapas e o número de linhas lidas.
+
+        'origin' substitui caller() como origem dos comandos, para os
+        que são executados em outra thread (ex: catalog.Prefetch).
+    """
+
+    def __init__(self, cursor, tracer, origin=None):
+        self.__cursor = cursor
+        self.__tracer = tracer
+        self.__origin = origin
+        self.__pending = None
+
+    def execute(self, statement, qargs=None):
+        start = time.time()
+        try:
+            return self.__cursor.execute(statement, qargs)
+        finally:
+            if self.__cursor.name is None:
+                self.__tracer.record(statement, qargs, time.time() - start,
+                                     self.__cursor.rowcount, self.__origin)
+            else:
+                self.__pending = (statement, qargs, time.time() - start,
+                                  self.__origin or caller())
+
+    def __iter__(self):
+        if self.__pending is None:
+            return iter(self.__cursor)
+
+        pending, self.__pending = self.__pending, None
+        return self.__traced(iter(self.__cursor), *pending)
+
+    def __traced(self, rows, statement, qargs, duration, origin):
+
+        """ Percorre as linhas de 'rows' somando o tempo gasto em trazê-las
+            (sem o tempo de quem as consome) e registra o comando ao fim
+            da leitura, mesmo que ela seja interrompida.
+        """
+
+        count = 0
+        try:
+            while True:
+                start = time.time()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+                finally:
+                    duration += time.time() - start
+
+                count += 1
+                yield row
+        finally:
+            self.__tracer.record(statement, qargs, duration, count, origin)
+
+    def __getattr__(self, name):
+        return getattr(self.__cursor, name)
+
+
+class Tracer(object):
+
+    """ Registra os comandos enviados ao banco de dados: fingerprint,
+        argumentos, duração, número de linhas e função de origem.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def wrap(self, cursor, origin=None):
+        return TracedCursor(cursor, self, origin)
+
+    def record(self, statement, qargs, duration, rowcount, origin=None):
+        self.records.append((fingerprint(statement), qargs, duration,
+                             rowcount, origin or caller()))
+
+    def reset(self):
+        del self.records[:]
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def __summary(self, index):
+
+        """ Lista de (chave, quantidade, total, p50, p95, máximo),
+            agrupando os registros pelo campo 'index', do maior
+            tempo total para o menor
+        """
+
+        groups = {}
+        for r in self.records:
+            groups.setdefault(r[index], []).append(r[2])
+
+        summary = []
+        for key, durations in groups.items():
+            durations.sort()
+            n = len(durations)
+            summary.append((key, n, sum(durations),
+                            durations[int((n - 1) * 0.50)],
+                            durations[int((n - 1) * 0.95)],
+                            durations[-1]))
+
+        summary.sort(key=lambda s: -s[2])
+        return summary
+
+    def report(self, stream=sys.stderr, slowest=10):
+
+        """ Escreve o resumo dos comandos por tipo e por origem,
+            e os comandos mais lentos
+        """
+
+        total = sum(r[2] for r in self.records)
+        stream.write(u"\n{0} comandos, {1:.3f}s no banco de dados\n"
+                     .format(len(self.records), total).encode('utf-8'))
+
+        for title, index in ((u"Por comando", 0), (u"Por origem", 4)):
+            stream.write(u"\n{0}:\n{1:>7} {2:>9} {3:>8} {4:>8} {5:>8}  {6}\n"
+                         .format(title, u"qtde", u"total", u"p50", u"p95",
+                                 u"máx", u"").encode('utf-8'))
+
+            for key, n, tot, p50, p95, top in self.__summary(index):
+                stream.write(
+                    u"{0:7d} {1:8.3f}s {2:7.1f}ms {3:7.1f}ms {4:7.1f}ms  {5}\n"
+                    .format(n, tot, p50 * 1000, p95 * 1000, top * 1000,
+                            key[:120]).encode('utf-8'))
+
+        stream.write(u"\nMais lentos:\n".encode('utf-8'))
+        for r in sorted(self.records, key=lambda r: -r[2])[:slowest]:
+            stream.write(u"{0:7.1f}ms {1:>7} linhas  {2}  {3}  {4}\n"
+                         .format(r[2] * 1000, r[3], r[4], format_args(r[1]),
+                                 r[0][:80]).encode('utf-8'))
+
+
+def format_args(qargs):
+
+    """ Argumentos de um comando, resumidos para o relatório """
+
+    text = repr(qargs)
+    if len(text) > 60:
+        text = text[:57] + "..."
+
+    return text.decode('ascii', 'replace')
+
+
+def profile(func, stats_file=None):
+
+    """ Executa func() registrando os comandos enviados ao banco de dados
+        e escreve o resumo ao final. Com 'stats_file', salva também as
+        estatísticas do cProfile nesse arquivo (ver módulo pstats).
+    """
+
+    from connection import Connection
+
+    tracer = Tracer()
+    Connection.set_tracer(tracer)
+
+    try:
+        if stats_file is None:
+            return func()
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func)
+        finally:
+            profiler.dump_stats(stats_file)
+
+    finally:
+        Connection.set_tracer(None)
+        tracer.report()
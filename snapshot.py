@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import time
+
+import catalog
+
+
+class Snapshot(object):
+
+    """ Cópia local do catálogo do banco de dados.
+
+        Guarda as linhas das consultas de catalog.QUERIES em um arquivo
+        JSON compactado, permitindo gerar a documentação e os yamls
+        sem acessar o banco de dados.
+    """
+
+    VERSION = 1
+
+    # Instâncias já abertas neste processo, por nome de arquivo
+    __opened = {}
+
+    def __init__(self, data):
+        self.__data = data
+
+    @classmethod
+    def capture(cls):
+
+        """ Lê todo o catálogo do banco de dados """
+
+        data = {"version": Snapshot.VERSION, "created": time.time()}
+
+        for key, query in catalog.QUERIES:
+            data[key] = [list(r) for r in catalog.fetch(key)]
+
+        return Snapshot(data)
+
+    @classmethod
+    def open(cls, fname):
+
+        """ Abre o snapshot salvo em 'fname' """
+
+        fname = os.path.abspath(fname)
+
+        if fname not in Snapshot.__opened:
+            fo = gzip.open(fname, "rb")
+            try:
+                data = json.load(fo)
+            finally:
+                fo.close()
+
+            if data.get("version") != Snapshot.VERSION:
+                raise ValueError(
+                    "Versão do snapshot '{0}' não suportada.".format(fname))
+
+            Snapshot.__opened[fname] = Snapshot(data)
+
+        return Snapshot.__opened[fname]
+
+    def save(self, fname):
+
+        """ Salva o snapshot no arquivo 'fname' """
+
+        tmp = fname + ".tmp"
+        fo = gzip.open(tmp, "wb")
+        try:
+            json.dump(self.__data, fo, separators=(",", ":"))
+        finally:
+            fo.close()
+
+        os.rename(tmp, fname)
+
+    def rows(self, key, names=None, filter=None):
+
+        """ Retorna as linhas da consulta 'key', limitadas aos schemas
+            com os nomes em 'names' e aos schemas e relações aceitos
+            pelo objeto filters.Filter 'filter', quando indicados.
+        """
+
+        rows = self.__data[key]
+
+        if names is None and filter is None:
+            return rows
+
+        def accepted(name):
+            return ((names is None or name in names) and
+                    (filter is None or filter.schema_matches(name)))
+
+        if names is not None:
+            names = set(names)
+
+        if key == "schemas":
+            return [r for r in rows if accepted(r[1])]
+        elif key == "fingerprints":
+            return [r for r in rows if accepted(r[0])]
+        elif key == "relations":
+            oids = set(r[0] for r in self.__data["schemas"]
+                       if accepted(r[1]))
+            return [r for r in rows if r[1] in oids and
+                    (filter is None or filter.relation_matches(r[2]))]
+
+        # As demais linhas são descartadas por catalog.load
+        # quando a relação não foi carregada.
+        return rows
+
+
+def open_snapshot(fname):
+
+    """ Retorna o Snapshot salvo em 'fname', ou None caso 'fname'
+        seja None (catálogo lido do banco de dados).
+    """
+
+    if fname is None:
+        return None
+
+    return Snapshot.open(fname)
+
+
+def snapshot(fname):
+
+    """ Salva todo o catálogo do banco de dados no arquivo 'fname' """
+
+    Snapshot.capture().save(fname)
@@ -0,0 +1,78 @@
+// Busca no índice gerado por htmldoc.html_all (search-index.json).
+// Cada entrada é [tipo, schema, relação, nome, descrição], com o schema
+// indicado pela sua posição em "schemas".
+(function () {
+    var LABELS = {s: "schema", t: "tabela", v: "view", c: "coluna", i: "índice"};
+    var MAX_RESULTS = 100;
+
+    var input = document.getElementById("search");
+    var results = document.getElementById("results");
+    var entries = [];
+
+    // Nome do arquivo de uma relação, como templating.file_name
+    function fileName(name) {
+        return name.replace(/[%\/\\\x00-\x1f\x7f]/g, function (c) {
+            var hex = c.charCodeAt(0).toString(16).toUpperCase();
+            return "%" + (hex.length < 2 ? "0" : "") + hex;
+        });
+    }
+
+    function link(schema, e) {
+        var url = encodeURIComponent(schema) + "/";
+        url += e[2] ? "relations/" + encodeURIComponent(fileName(e[2])) +
+            ".html" : "index.html";
+        if (e[0] === "c" || e[0] === "i") {
+            url += "#" + e[0] + "-" + encodeURIComponent(e[3]);
+        }
+        return url;
+    }
+
+    function search() {
+        var terms = input.value.toLowerCase().split(/\s+/).filter(Boolean);
+        results.innerHTML = "";
+        if (!terms.length) {
+            return;
+        }
+
+        var found = 0;
+        for (var i = 0; i < entries.length && found < MAX_RESULTS; i++) {
+            var text = entries[i].text, matches = true;
+            for (var j = 0; j < terms.length && matches; j++) {
+                matches = text.indexOf(terms[j]) !== -1;
+            }
+            if (!matches) {
+                continue;
+            }
+
+            var e = entries[i].entry, schema = entries[i].schema;
+            var li = document.createElement("li");
+            var a = document.createElement("a");
+            a.href = link(schema, e);
+            a.textContent = [schema, e[2], e[3]].filter(Boolean).join(".");
+            li.appendChild(a);
+            li.appendChild(document.createTextNode(
+                " (" + LABELS[e[0]] + ")" + (e[4] ? " " + e[4] : "")));
+            results.appendChild(li);
+            found++;
+        }
+    }
+
+    var request = new XMLHttpRequest();
+    request.open("GET", "search-index.json");
+    request.overrideMimeType("application/json; charset=utf-8");
+    request.onload = function () {
+        var index = JSON.parse(request.responseText);
+        entries = index.entries.map(function (e) {
+            var schema = index.schemas[e[1]];
+            return {
+                entry: e,
+                schema: schema,
+                text: [schema, e[2], e[3], e[4]].join(" ").toLowerCase()
+            };
+        });
+        search();
+    };
+    request.send();
+
+    input.addEventListener("input", search);
+})();
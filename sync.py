@@ -1,64 +1,132 @@
 # -*- coding: utf-8 -*-
 import yaml
 import os
+import warnings
+from exceptions import RuntimeWarning
 
+import catalog
+import incremental
+import workers
+from comments import CommentDiff, CommentWriter
 from models import Schema
+from snapshot import open_snapshot
+from writer import Writer
+import yamlstream
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
-def __create_yaml(path, schema):
 
-    """ Cria o yaml de um objeto Schema na pasta 'path' """
+def __create_yaml(path, schema, writer):
 
-    stream = file(path+"/"+schema.name+".yaml", 'w')
-    yaml.safe_dump(schema.to_dic(),
-                   stream=stream,
-                   encoding=('utf-8'),
-                   allow_unicode=True,
-                   default_flow_style=False)
+    """ Cria o yaml de um objeto Schema na pasta 'path',
+        gravado pelo Writer 'writer'
+    """
+
+    with writer.open(path+"/"+schema.name+".yaml") as stream:
+        yamlstream.dump_schema(schema, stream)
 
 
-def schema_yaml(path, schema):
+def schema_yaml(path, schema, snapshot=None, filter=None):
 
     """ Cria o yaml para um schema de nome 'schema' na pasta 'path' """
 
-    s = Schema.with_name(schema)
+    s = catalog.load_schema(schema, open_snapshot(snapshot), filter)
 
     if not s:
         print "Schema com nome '%s' não encontrado." % (schema,)
     else:
-        __create_yaml(path, s)
+        with Writer() as writer:
+            __create_yaml(path, s, writer)
+
+
+def __schema_yamls(args):
+
+    """ Cria na pasta 'path' os yamls dos schemas com os nomes
+        indicados. Executada pelos processos de all_yamls.
+    """
+
+    path, snapshot, filter, names = args
+
+    with Writer() as writer:
+        for s in catalog.load(names, open_snapshot(snapshot), filter):
+            __create_yaml(path, s, writer)
 
 
-def all_yamls(path):
+def all_yamls(path, jobs=1, force=False, snapshot=None, filter=None):
 
     """ Cria na pasta 'path' os yamls
-        para todos os schemas do banco de dados
+        para todos os schemas do banco de dados.
+
+        Ver incremental.generate para 'jobs', 'force', 'snapshot'
+        e 'filter'.
     """
 
-    schemas = Schema.all()
+    incremental.generate(__schema_yamls, path, ".yaml", jobs=jobs,
+                         force=force, snapshot=snapshot, filter=filter)
 
-    if not schemas:
-        print "Nenhum schema encontrado."
 
-    for s in schemas:
-        __create_yaml(path, s)
+def __sync(fname, lock_timeout=None, statement_timeout=None):
 
+    """ Sincroniza com o banco de dados as descrições do yaml 'fname',
+        em lotes confirmados um a um. Retorna (sucesso, mensagem).
+        Ver CommentWriter para 'lock_timeout' e 'statement_timeout'.
+    """
 
-def __sync(fname):
-    stream = file(fname, 'r')
-    print "syncing "+fname
-    dic = yaml.safe_load(stream=stream)
+    with open(fname, 'r') as stream:
+        dic = yaml.load(stream, Loader=SafeLoader)
 
     s = Schema.from_dic(dic)
 
-    s.sync_description()
+    writer = CommentWriter(lock_timeout=lock_timeout,
+                           statement_timeout=statement_timeout)
+
+    # Erros do banco de dados, inclusive ao ler as descrições atuais, não
+    # são erros do arquivo (ver __sync_files)
+    try:
+        diff = CommentDiff(catalog.descriptions(s.name))
+        writer.apply(diff.filter(s.comments()))
+    except Exception, e:
+        return False, u"Erro ao sincronizar o schema {0}: {1}".format(
+            s.name, str(e).decode('utf-8', 'replace'))
+
+    return (not writer.failed and not writer.busy,
+            u"{0}: {1} adicionadas, {2} alteradas, {3} removidas, "
+            u"{4} inalteradas, {5} com erro, {6} bloqueadas"
+            .format(s.name, diff.added, diff.changed, diff.cleared,
+                    diff.unchanged, len(writer.failed), len(writer.busy)))
+
+
+def __sync_files(args):
 
+    """ Sincroniza os yamls indicados, um por vez, e retorna a lista de
+        (arquivo, sucesso, mensagem). Executada pelos processos de
+        sync_all; um erro em um arquivo não interrompe os demais.
+    """
+
+    lock_timeout, statement_timeout, fnames = args
+    results = []
+
+    for fname in fnames:
+        try:
+            ok, message = __sync(fname, lock_timeout, statement_timeout)
+        except Exception, e:
+            ok, message = False, u"Erro ao ler o arquivo: {0}".format(
+                str(e).decode('utf-8', 'replace'))
+
+        results.append((fname, ok, message))
 
-def sync_schema(path, schema):
+    return results
+
+
+def sync_schema(path, schema, lock_timeout=None, statement_timeout=None):
 
     """ Sincroniza as descrições de um schema no banco de dados
         de acordo com as descrições num arquivo 'schema'.yaml no
-        path especificado.
+        path especificado. Ver CommentWriter para 'lock_timeout' e
+        'statement_timeout'.
     """
 
     fname = "%s/%s.yaml" % (path, schema)
@@ -67,17 +135,54 @@ def sync_schema(path, schema):
                .format(fname, schema))
         return
 
-    __sync(fname)
+    print "syncing "+fname
+    ok, message = __sync(fname, lock_timeout, statement_timeout)
 
+    if ok:
+        print message.encode('utf-8')
+    else:
+        warnings.warn(message.encode('utf-8'), RuntimeWarning)
 
-def sync_all(path):
+
+def sync_all(path, jobs=1, lock_timeout=None, statement_timeout=None):
 
     """ Sincroniza as descrições de todos schemas cujos yamls
-        com as descrições estiverem em 'path'
+        com as descrições estiverem em 'path'.
+
+        Cada yaml é aplicado em lotes, cada um em sua própria transação
+        (ver CommentWriter). Com 'jobs' maior que 1, os arquivos são
+        divididos entre 'jobs' processos, cada um com as suas conexões.
+        Ao final, escreve o resultado de cada arquivo e retorna o número
+        de arquivos com erro, inclusive os com objetos que não puderam
+        ser bloqueados (ver CommentWriter para 'lock_timeout' e
+        'statement_timeout').
     """
 
+    fnames = []
     for root, dirs, files in os.walk(path):
         for f in files:
             fullpath = os.path.join(root, f)
             if os.path.splitext(fullpath)[1] == '.yaml':
-                __sync(fullpath)
+                fnames.append(fullpath)
+
+    if jobs > 1 and len(fnames) > 1:
+        results = []
+        for chunk in workers.run(__sync_files, fnames, jobs, lock_timeout,
+                                 statement_timeout):
+            results.extend(chunk)
+    else:
+        results = __sync_files((lock_timeout, statement_timeout, fnames))
+
+    failed = 0
+    for fname, ok, message in sorted(results):
+        if not ok:
+            failed += 1
+
+        print (u"{0:4}  {1}  {2}".format(ok and u"OK" or u"ERRO",
+                                         fname.decode('utf-8', 'replace'),
+                                         message).encode('utf-8'))
+
+    print "%d arquivo(s) sincronizado(s), %d com erro." % (
+        len(results) - failed, failed)
+
+    return failed
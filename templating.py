@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+import atexit
+import os
+import re
+import shutil
+import urllib
+import warnings
+
+from jinja2 import (Environment, PackageLoader, ModuleLoader, ChoiceLoader,
+                    FileSystemBytecodeCache)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'templates')
+
+# Pasta com os templates pré-compilados (comando compile_templates)
+COMPILED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'compiled_templates')
+
+# Arquivo criado ao fim da pré-compilação. Os módulos só são usados
+# enquanto forem mais novos que todos os templates.
+__STAMP = '.compiled'
+
+# Opções do Environment de cada variante de templates
+VARIANTS = {
+    'text': {},
+    'html': {'autoescape': True},
+}
+
+# Pasta de TEMPLATES_DIR com os templates html; os demais são de texto
+__HTML_PREFIX = 'html/'
+
+# Pasta, dentro da pasta de cada schema, com um arquivo por relação
+# (doc_all com 'split' e html_all)
+RELATIONS_DIR = 'relations'
+
+# Número de trechos do template agrupados a cada escrita (ver render)
+STREAM_CHUNKS = 64
+
+# Caracteres trocados por %XX nos nomes dos arquivos das relações. Ver
+# também fileName em static/search.js.
+__UNSAFE = re.compile(ur'[%/\\\x00-\x1f\x7f]')
+
+# Caracteres que delimitam o texto de um link em markdown
+__MARKDOWN_LINK = re.compile(ur'([\\\[\]])')
+
+__environments = {}
+
+# Os módulos pré-compilados precisam ser descarregados antes do
+# encerramento do interpretador (ver jinja2.ModuleLoader).
+atexit.register(__environments.clear)
+
+
+def __newest_template():
+    newest = 0
+    for root, dirs, files in os.walk(TEMPLATES_DIR):
+        for f in files:
+            newest = max(newest, os.path.getmtime(os.path.join(root, f)))
+
+    return newest
+
+
+def file_name(name):
+
+    """ Nome do arquivo (sem extensão) da relação de nome 'name', com os
+        caracteres que não podem aparecer em nomes de arquivos trocados
+        por %XX. Ex: 'a/b' -> 'a%2Fb'
+    """
+
+    return __UNSAFE.sub(lambda m: u'%%%02X' % ord(m.group()), name)
+
+
+def relation_files(schema, ext):
+
+    """ Nomes dos arquivos, com a extensão 'ext', das tabelas e views do
+        objeto Schema 'schema' na pasta RELATIONS_DIR
+    """
+
+    return set(file_name(rel.name) + ext
+               for rel in schema.tables() + schema.views())
+
+
+def remove_stale(folder, names):
+
+    """ Remove da pasta 'folder' os arquivos que não estão em 'names',
+        de relações que deixaram de existir. Chamada somente depois que
+        os novos arquivos foram gravados (ver writer.Writer.close).
+    """
+
+    for f in os.listdir(folder):
+        if f not in names:
+            os.remove(os.path.join(folder, f))
+
+
+def file_link(name):
+
+    """ file_name(name) codificado para ser usado em um link """
+
+    return urllib.quote(file_name(name).encode('utf-8'), safe='')
+
+
+def link_text(name):
+
+    """ Texto de um link em markdown, com '[', ']' e '\\' escapados """
+
+    return __MARKDOWN_LINK.sub(ur'\\\1', name)
+
+
+# Filtros disponíveis nos templates
+FILTERS = {
+    'file_link': file_link,
+    'link_text': link_text,
+}
+
+
+def __compiled_dir(variant):
+
+    """ Pasta com os módulos pré-compilados da variante, ou None caso
+        eles não existam ou estejam desatualizados.
+    """
+
+    path = os.path.join(COMPILED_DIR, variant)
+    stamp = os.path.join(path, __STAMP)
+
+    if (not os.path.isfile(stamp)
+            or os.path.getmtime(stamp) < __newest_template()):
+        return None
+
+    return path
+
+
+def templates(variant):
+
+    """ Filtro (para Environment.list_templates) dos nomes dos
+        templates que pertencem à variante indicada
+    """
+
+    if variant == 'html':
+        return lambda name: name.startswith(__HTML_PREFIX)
+
+    return lambda name: not name.startswith(__HTML_PREFIX)
+
+
+def __cache_dir():
+
+    """ Pasta padrão do cache de bytecode: 'docgen' dentro de
+        XDG_CACHE_HOME (ou ~/.cache), criada somente para o usuário.
+
+        Retorna None caso ela pertença a outro usuário ou possa ser
+        alterada por outros: o bytecode do cache é executado.
+    """
+
+    base = (os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    directory = os.path.join(base, 'docgen')
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0077:
+        warnings.warn("Cache de templates ignorado: a pasta '%s' não é "
+                      "exclusiva do usuário" % (directory,), RuntimeWarning)
+        return None
+
+    return directory
+
+
+def __bytecode_cache(variant):
+
+    """ Cache do bytecode dos templates compilados, compartilhado entre
+        execuções. A pasta pode ser indicada na variável de ambiente
+        DOCGEN_CACHE_DIR; a padrão é a de __cache_dir. Não usa a pasta
+        temporária padrão do Jinja, que pode ter sido criada por outro
+        usuário (CVE-2014-0012). None caso não haja uma pasta segura.
+
+        Cada variante tem os seus próprios arquivos: a chave do cache
+        do Jinja não inclui as opções do Environment (ex: autoescape).
+    """
+
+    directory = os.environ.get('DOCGEN_CACHE_DIR')
+
+    if not directory:
+        directory = __cache_dir()
+        if directory is None:
+            return None
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    return FileSystemBytecodeCache(
+        directory, '__docgen_' + variant + '_%s.cache')
+
+
+def environment(variant='text'):
+
+    """ Retorna o Environment do Jinja da variante indicada.
+
+        Usa os templates pré-compilados quando atualizados. Caso
+        contrário, compila os templates usando o cache de bytecode.
+    """
+
+    if variant not in __environments:
+        loader = PackageLoader('docgen', 'templates')
+        compiled = __compiled_dir(variant)
+
+        if compiled is not None:
+            loader = ChoiceLoader([ModuleLoader(compiled), loader])
+
+        env = Environment(loader=loader,
+                          bytecode_cache=__bytecode_cache(variant),
+                          **VARIANTS[variant])
+        env.filters.update(FILTERS)
+        __environments[variant] = env
+
+    return __environments[variant]
+
+
+def render(writer, variant, template, fname, **context):
+
+    """ Escreve o template 'template' da variante indicada no arquivo
+        'fname' pelo writer.Writer 'writer'
+
+        O documento é enviado à gravação à medida que o template é
+        renderizado, sem montar o texto completo em memória.
+    """
+
+    stream = environment(variant).get_template(template).stream(**context)
+    stream.enable_buffering(STREAM_CHUNKS)
+
+    with writer.open(fname) as fo:
+        stream.dump(fo, encoding='utf-8')
+
+
+def preload(variant='text'):
+
+    """ Carrega todos os templates da variante, para que processos
+        criados depois (multiprocessing) já os recebam compilados.
+    """
+
+    env = environment(variant)
+
+    for name in env.list_templates(filter_func=templates(variant)):
+        env.get_template(name)
+
+
+def source(name):
+
+    """ Retorna o código fonte do template 'name' """
+
+    with open(os.path.join(TEMPLATES_DIR, name)) as fo:
+        return fo.read()
+
+
+def compile_templates():
+
+    """ Pré-compila todos os templates em módulos Python
+        na pasta COMPILED_DIR
+    """
+
+    for variant, options in VARIANTS.items():
+        path = os.path.join(COMPILED_DIR, variant)
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+        env = Environment(loader=PackageLoader('docgen', 'templates'),
+                          **options)
+        env.filters.update(FILTERS)
+        env.compile_templates(path, zip=None, py_compile=True,
+                              ignore_errors=False,
+                              filter_func=templates(variant))
+
+        open(os.path.join(path, __STAMP), 'w').close()
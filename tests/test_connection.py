@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import psycopg2
+import psycopg2.extensions
+
+from docgen import catalog
+from docgen.benchmark import FakeConnection, SyntheticCatalog
+from docgen.connection import Connection
+
+# Respondida por FakeConnection com os schemas do catálogo sintético
+QUERY = catalog.SCHEMAS_QUERY.split("{")[0]
+
+
+class FailingConnection(FakeConnection):
+
+    """ Conexão simulada cujos cursores falham ao serem fechados.
+        'error' é o erro da leitura das linhas: None, 'cancel' (comando
+        cancelado, a transação fica abortada) ou 'drop' (conexão perdida).
+    """
+
+    def __init__(self, synthetic, error=None):
+        FakeConnection.__init__(self, synthetic)
+        self.error = error
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        cursor = FakeConnection.cursor(self, name)
+        conn = self
+
+        def close():
+            raise psycopg2.InternalError("current transaction is aborted")
+
+        def rows():
+            if conn.error == 'cancel':
+                raise psycopg2.extensions.QueryCanceledError(
+                    "canceling statement due to statement timeout")
+            if conn.error == 'drop':
+                conn.closed = 2
+                raise psycopg2.OperationalError("server closed the connection")
+            return iter(cursor.fetchall())
+
+        cursor.close = close
+        cursor.__class__ = type("FailingCursor", (cursor.__class__,),
+                                {"__iter__": lambda self: rows()})
+        return cursor
+
+    def rollback(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+        FakeConnection.rollback(self)
+
+    def __setattr__(self, name, value):
+        # Como no psycopg2, autocommit não pode ser alterado no meio
+        # de uma transação nem em uma conexão fechada
+        if name == "autocommit" and hasattr(self, "rollbacks"):
+            if self.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            if (self.get_transaction_status() !=
+                    psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+                raise psycopg2.ProgrammingError(
+                    "set_session cannot be used inside a transaction")
+
+        FakeConnection.__setattr__(self, name, value)
+
+
+class StreamCleanupTest(unittest.TestCase):
+
+    """ Connection.stream deve desfazer a transação mesmo quando o
+        cursor não pode ser fechado, sem esconder o erro original, e
+        descartar a conexão perdida
+    """
+
+    def setUp(self):
+        self.synthetic = SyntheticCatalog(schemas=1, tables=1, columns=1)
+        self.connections = []
+        self.error = None
+        Connection.configure(dsn="fake", maxconn=1, connect=self.__connect)
+
+    def tearDown(self):
+        Connection.configure()
+
+    def __connect(self, dsn):
+        conn = FailingConnection(self.synthetic, self.error)
+        self.connections.append(conn)
+        return conn
+
+    def test_close_error(self):
+        self.assertEqual(len(list(Connection.stream(QUERY))), 1)
+
+        conn = self.connections[0]
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertTrue(conn.autocommit)
+
+        # A conexão volta ao pool e é reutilizada
+        list(Connection.stream(QUERY))
+        self.assertEqual(len(self.connections), 1)
+
+    def test_query_error(self):
+        self.error = 'cancel'
+        self.assertRaises(psycopg2.extensions.QueryCanceledError, list,
+                          Connection.stream(QUERY))
+
+        conn = self.connections[0]
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertTrue(conn.autocommit)
+
+    def test_dropped_connection(self):
+        self.error = 'drop'
+        self.assertRaises(psycopg2.OperationalError, list,
+                          Connection.stream(QUERY))
+
+        # A conexão perdida é descartada em vez de voltar ao pool
+        self.error = None
+        self.assertEqual(len(list(Connection.stream(QUERY))), 1)
+        self.assertEqual(len(self.connections), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import fnmatch
+import re
+import unittest
+
+from docgen.filters import to_regex
+
+NAMES = [u"tenant_1", u"tenant_a", u"log_2019", u"log_19", u"_interna",
+         u"a.b", u"x]y", u"x!y", u"^z", u"a[b"]
+
+
+class GlobTest(unittest.TestCase):
+
+    """ Os globs devem aceitar os mesmos nomes que fnmatch """
+
+    def assertSameAsFnmatch(self, pattern):
+        regex = re.compile(to_regex(pattern), re.UNICODE)
+        self.assertEqual([n for n in NAMES if regex.search(n)],
+                         fnmatch.filter(NAMES, pattern), pattern)
+
+    def test_wildcards(self):
+        for pattern in (u"tenant_*", u"log_??", u"a.b", u"*"):
+            self.assertSameAsFnmatch(pattern)
+
+    def test_classes(self):
+        for pattern in (u"tenant_[0-9]", u"log_20[0-9][0-9]", u"[!_]*",
+                        u"x[]]y", u"x[!]]y", u"[^]z", u"a[b"):
+            self.assertSameAsFnmatch(pattern)
+
+    def test_regex_prefix(self):
+        self.assertEqual(to_regex(u"re:^log_\\d+$"), u"^log_\\d+$")
+
+
+if __name__ == '__main__':
+    unittest.main()
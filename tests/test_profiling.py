@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from docgen import catalog
+from docgen.benchmark import FakeConnection, SyntheticCatalog
+from docgen.connection import Connection
+from docgen.profiling import Tracer
+
+
+class CatalogOriginTest(unittest.TestCase):
+
+    """ As consultas de catalog.load, mesmo as feitas pelas threads de
+        catalog.Prefetch, devem ser atribuídas a quem chamou load()
+    """
+
+    def setUp(self):
+        synthetic = SyntheticCatalog(schemas=2, tables=3, columns=4)
+        Connection.configure(dsn="fake", maxconn=4,
+                             connect=lambda dsn: FakeConnection(synthetic))
+        self.tracer = Tracer()
+        Connection.set_tracer(self.tracer)
+
+    def tearDown(self):
+        Connection.set_tracer(None)
+        Connection.configure()
+
+    def test_load(self):
+        schemas = catalog.load()
+        self.assertEqual(len(schemas), 2)
+
+        # Todas as consultas de QUERIES, exceto a das impressões digitais
+        origins = [r[4] for r in self.tracer.records]
+        self.assertEqual(origins, [u"CatalogOriginTest.test_load"] *
+                         (len(catalog.QUERIES) - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+from docgen import templating
+from docgen.models import Schema
+
+SCRIPT = u"<script>alert(1)</script>"
+
+
+class AutoescapeTest(unittest.TestCase):
+
+    """ Os templates html devem escapar as descrições mesmo quando
+        compilados antes pela variante 'text' (ver templating.preload)
+    """
+
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        self.previous = os.environ.get('DOCGEN_CACHE_DIR')
+        os.environ['DOCGEN_CACHE_DIR'] = self.cache
+        getattr(templating, '__environments').clear()
+
+    def tearDown(self):
+        getattr(templating, '__environments').clear()
+        if self.previous is None:
+            del os.environ['DOCGEN_CACHE_DIR']
+        else:
+            os.environ['DOCGEN_CACHE_DIR'] = self.previous
+        shutil.rmtree(self.cache)
+
+    def __render(self):
+        schema = Schema(name=u"s", description=SCRIPT)
+        schema.set_tables([])
+        schema.set_views([])
+
+        # Novo Environment, como em outro processo: lê o cache do disco
+        getattr(templating, '__environments').clear()
+
+        return (templating.environment('html')
+                .get_template('html/schema.html')
+                .render(schema=schema, root=""))
+
+    def test_preload_text(self):
+        templating.preload()
+        templating.preload('html')
+
+        html = self.__render()
+        self.assertNotIn(SCRIPT, html)
+        self.assertIn(u"&lt;script&gt;", html)
+
+    def test_text_cache(self):
+        templating.environment('text').get_template('html/schema.html')
+
+        html = self.__render()
+        self.assertNotIn(SCRIPT, html)
+        self.assertIn(u"&lt;script&gt;", html)
+
+    def test_preload_variant(self):
+        templating.preload()
+
+        env = templating.environment('text')
+        names = list(env.list_templates(
+            filter_func=templating.templates('text')))
+
+        self.assertNotIn('html/schema.html', names)
+        self.assertEqual(len(os.listdir(self.cache)), len(names))
+
+
+class CacheDirTest(unittest.TestCase):
+
+    """ Sem DOCGEN_CACHE_DIR, o cache de bytecode só deve usar uma pasta
+        exclusiva do usuário
+    """
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.previous = dict((name, os.environ.pop(name, None))
+                             for name in ('DOCGEN_CACHE_DIR',
+                                          'XDG_CACHE_HOME'))
+        os.environ['XDG_CACHE_HOME'] = self.base
+        getattr(templating, '__environments').clear()
+
+    def tearDown(self):
+        getattr(templating, '__environments').clear()
+        for name, value in self.previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.base)
+
+    def test_default(self):
+        env = templating.environment('text')
+        directory = os.path.join(self.base, 'docgen')
+
+        self.assertEqual(env.bytecode_cache.directory, directory)
+        self.assertEqual(os.stat(directory).st_mode & 0777, 0700)
+
+    def test_shared(self):
+        directory = os.path.join(self.base, 'docgen')
+        os.mkdir(directory)
+        os.chmod(directory, 0777)
+
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            env = templating.environment('text')
+
+        self.assertIsNone(env.bytecode_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from StringIO import StringIO
+
+import yaml
+
+from docgen import yamlstream
+from docgen.models import Schema, Table, View, Column
+
+DESCRIPTIONS = [
+    None,
+    u"",
+    u"Clientes",
+    u"com\ttabulação " * 10,
+    u"linha longa " * 20,
+    u"\"aspas\" e 'apóstrofos': " * 8,
+    u"primeira linha\nsegunda linha " * 6,
+    u"  espaços nas pontas  ",
+    u"null",
+    u"123",
+    u"- item: valor #comentário " * 5,
+]
+
+
+def schema(descriptions):
+    s = Schema(name=u"vendas", description=descriptions[0])
+
+    tables = []
+    for i, description in enumerate(descriptions[1:]):
+        t = Table(schema=s.name, name=u"t%d" % i, description=description)
+        t.set_columns([Column(schema=s.name, table=t.name, name=u"c%d" % j,
+                              description=d)
+                       for j, d in enumerate(descriptions)])
+        tables.append(t)
+    s.set_tables(tables)
+
+    v = View(schema=s.name, name=u"v", description=descriptions[-1])
+    v.set_columns([])
+    s.set_views([v])
+
+    return s
+
+
+class DumpSchemaTest(unittest.TestCase):
+
+    """ dump_schema deve gerar o mesmo arquivo que yaml.safe_dump """
+
+    def assertSameYaml(self, s):
+        expected = yaml.safe_dump(s.to_dic(), encoding='utf-8',
+                                  allow_unicode=True,
+                                  default_flow_style=False)
+
+        stream = StringIO()
+        yamlstream.dump_schema(s, stream)
+
+        self.assertEqual(stream.getvalue(), expected)
+
+    def test_descriptions(self):
+        self.assertSameYaml(schema(DESCRIPTIONS))
+
+    def test_random(self):
+        rnd = random.Random(0)
+        words = [u"a", u"ção", u"\t", u" ", u"\"", u":", u"#", u"\n",
+                 u"descrição", u"x" * 30]
+
+        for i in range(50):
+            descriptions = [u"".join(rnd.choice(words)
+                                     for k in range(rnd.randint(0, 40)))
+                            for j in range(4)]
+            self.assertSameYaml(schema(descriptions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import select
+import shutil
+import time
+import traceback
+
+import psycopg2
+
+import doc
+from connection import Connection
+
+# Canal do NOTIFY enviado pelos event triggers
+CHANNEL = 'docgen_ddl'
+
+# Segundos sem novas alterações antes de gerar a documentação e tempo
+# máximo que uma alteração espera, mesmo com alterações contínuas
+DEBOUNCE = 2.0
+MAX_DELAY = 30.0
+
+# Segundos entre as tentativas de reconectar ao banco de dados
+RECONNECT_DELAY = 5.0
+
+# Event triggers que enviam, para cada comando DDL (inclusive COMMENT)
+# ou objeto removido, um NOTIFY com o schema afetado. Exige superusuário.
+INSTALL_SQL = """
+CREATE OR REPLACE FUNCTION public.docgen_notify_ddl()
+RETURNS event_trigger LANGUAGE plpgsql AS $$
+DECLARE
+    r record;
+BEGIN
+    IF TG_EVENT = 'sql_drop' THEN
+        FOR r IN SELECT DISTINCT COALESCE(
+                     d.schema_name,
+                     CASE WHEN d.object_type = 'schema'
+                          THEN d.object_name END) AS nspname
+                 FROM pg_catalog.pg_event_trigger_dropped_objects() d
+        LOOP
+            IF r.nspname IS NOT NULL THEN
+                PERFORM pg_catalog.pg_notify('docgen_ddl', json_build_object(
+                    'schema', r.nspname, 'tag', TG_TAG)::text);
+            END IF;
+        END LOOP;
+    ELSE
+        FOR r IN SELECT DISTINCT COALESCE(
+                     c.schema_name,
+                     CASE WHEN c.object_type = 'schema'
+                          THEN (SELECT ns.nspname
+                                FROM pg_catalog.pg_namespace ns
+                                WHERE ns.oid = c.objid) END) AS nspname
+                 FROM pg_catalog.pg_event_trigger_ddl_commands() c
+        LOOP
+            IF r.nspname IS NOT NULL THEN
+                PERFORM pg_catalog.pg_notify('docgen_ddl', json_build_object(
+                    'schema', r.nspname, 'tag', TG_TAG)::text);
+            END IF;
+        END LOOP;
+    END IF;
+END;
+$$;
+
+DROP EVENT TRIGGER IF EXISTS docgen_ddl_command_end;
+CREATE EVENT TRIGGER docgen_ddl_command_end ON ddl_command_end
+    EXECUTE PROCEDURE public.docgen_notify_ddl();
+
+DROP EVENT TRIGGER IF EXISTS docgen_sql_drop;
+CREATE EVENT TRIGGER docgen_sql_drop ON sql_drop
+    EXECUTE PROCEDURE public.docgen_notify_ddl();
+"""
+
+UNINSTALL_SQL = """
+DROP EVENT TRIGGER IF EXISTS docgen_ddl_command_end;
+DROP EVENT TRIGGER IF EXISTS docgen_sql_drop;
+DROP FUNCTION IF EXISTS public.docgen_notify_ddl();
+"""
+
+
+def __execute(statement):
+    conn = psycopg2.connect(Connection.pool().dsn)
+    try:
+        conn.autocommit = True
+        conn.cursor().execute(statement)
+    finally:
+        conn.close()
+
+
+def install():
+
+    """ Cria os event triggers que avisam das alterações no banco """
+
+    __execute(INSTALL_SQL)
+
+
+def uninstall():
+
+    """ Remove os event triggers criados por install() """
+
+    __execute(UNINSTALL_SQL)
+
+
+def __listen():
+
+    """ Abre a conexão que recebe os avisos dos event triggers """
+
+    conn = psycopg2.connect(Connection.pool().dsn)
+    conn.autocommit = True
+    conn.cursor().execute("LISTEN " + CHANNEL)
+
+    return conn
+
+
+def __remove(path, name, split):
+
+    """ Remove os arquivos de um schema que deixou de existir """
+
+    if split:
+        folder = os.path.join(path, name)
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+    else:
+        fname = os.path.join(path, name + ".md")
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+
+def __update(path, names, split):
+
+    """ Gera a documentação dos schemas 'names' que mudaram e remove
+        a dos que deixaram de existir
+    """
+
+    print "Atualizando: %s" % (", ".join(sorted(names)).encode('utf-8'),)
+
+    found = doc.doc_all(path, split=split, names=sorted(names))
+
+    for name in set(names) - set(found):
+        __remove(path, name, split)
+
+
+def __generate(path, split, names=None):
+
+    """ Gera a documentação de todos os schemas alterados ou, com 'names',
+        somente desses (ver __update). Um erro na geração (ex: de
+        gravação ou de template) é escrito e não interrompe o watch.
+        Retorna True caso a geração tenha sido concluída.
+    """
+
+    try:
+        if names is None:
+            doc.doc_all(path, split=split)
+        else:
+            __update(path, names, split)
+        return True
+    except Exception:
+        print "Erro ao gerar a documentação:"
+        traceback.print_exc()
+        return False
+
+
+def __receive(conn, pending):
+
+    """ Acrescenta a 'pending' os schemas dos avisos recebidos.
+        Retorna True caso algum tenha sido recebido.
+    """
+
+    conn.poll()
+    received = bool(conn.notifies)
+
+    while conn.notifies:
+        notify = conn.notifies.pop(0)
+        try:
+            pending.add(json.loads(notify.payload)["schema"])
+        except (ValueError, KeyError):
+            pass
+
+    return received
+
+
+def watch(path, split=False, debounce=DEBOUNCE, max_delay=MAX_DELAY):
+
+    """ Mantém atualizada a documentação em markdown da pasta 'path'
+        (ver doc.doc_all), até ser interrompido.
+
+        Recebe os avisos dos event triggers (ver install) e, 'debounce'
+        segundos após a última alteração, gera somente os schemas
+        afetados. Ao iniciar e após perder a conexão, gera os schemas
+        alterados desde a última execução, pois os avisos enviados
+        nesse meio tempo são perdidos. Os schemas cuja geração falhou
+        são gerados novamente junto com a próxima alteração.
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    conn = None
+    pending = set()
+    failed = set()
+    first = last = None
+
+    try:
+        while True:
+            try:
+                if conn is None:
+                    conn = __listen()
+                    if __generate(path, split):
+                        failed.clear()
+                    print "Aguardando alterações..."
+
+                if pending:
+                    timeout = max(0, min(last + debounce,
+                                         first + max_delay) - time.time())
+                else:
+                    timeout = None
+
+                if select.select([conn], [], [], timeout)[0]:
+                    if __receive(conn, pending):
+                        last = time.time()
+                        first = first or last
+                    continue
+
+                names, pending, first = pending | failed, set(), None
+                failed = set() if __generate(path, split, names) else names
+
+            # Somente a perda da conexão dos avisos exige reconectar
+            except (psycopg2.OperationalError, psycopg2.InterfaceError), e:
+                print "Conexão perdida: %s" % (e,)
+                if conn is not None and not conn.closed:
+                    conn.close()
+                conn = None
+                time.sleep(RECONNECT_DELAY)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if conn is not None and not conn.closed:
+            conn.close()
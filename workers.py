@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+
+from connection import Connection
+
+
+def __chunks(items, jobs):
+
+    """ Divide 'items' em pedaços, alguns por processo, para equilibrar
+        a carga entre eles.
+    """
+
+    size = max(1, len(items) // (jobs * 4))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def __traced(args):
+
+    """ Executa func(args) registrando os comandos enviados ao banco de
+        dados pelo processo e retorna (resultado, registros)
+    """
+
+    func, args = args
+    tracer = Connection.tracer()
+    tracer.reset()
+    result = func(args)
+
+    return result, tracer.records
+
+
+def run(func, items, jobs, *args):
+
+    """ Executa func(args + (pedaço,)) para pedaços de 'items' em 'jobs'
+        processos e retorna a lista com os resultados.
+
+        'func' deve ser uma função de módulo, para poder ser enviada
+        aos processos. Cada processo abre as suas próprias conexões
+        com o banco de dados (ver Connection.pool). Os comandos
+        registrados pelos processos são reunidos no Tracer do
+        processo atual, quando houver um.
+    """
+
+    tasks = [args + (chunk,) for chunk in __chunks(items, jobs)]
+    tracer = Connection.tracer()
+
+    pool = multiprocessing.Pool(jobs)
+
+    try:
+        if tracer is None:
+            results = pool.map(func, tasks, chunksize=1)
+        else:
+            results = []
+            for result, records in pool.map(
+                    __traced, [(func, t) for t in tasks], chunksize=1):
+                results.append(result)
+                tracer.extend(records)
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return results
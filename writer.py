@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import Queue
+import sys
+import threading
+
+# Número de threads de gravação, tamanho dos trechos enviados a elas e
+# número máximo de trechos aguardando gravação em cada uma
+THREADS = 2
+CHUNK_SIZE = 64 * 1024
+MAX_CHUNKS = 16
+
+
+class WriterFile(object):
+
+    """ Arquivo aberto por Writer.open(). Os dados escritos são agrupados
+        em trechos de até 'chunk_size' bytes e enviados à thread do
+        arquivo, que os grava na mesma ordem.
+    """
+
+    def __init__(self, fname, queue, chunk_size):
+        self.fname = fname
+        self.__queue = queue
+        self.__chunk_size = chunk_size
+        self.__parts = []
+        self.__size = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        self.__parts.append(data)
+        self.__size += len(data)
+
+        if self.__size >= self.__chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.__parts:
+            self.__queue.put((self, "".join(self.__parts)))
+            self.__parts = []
+            self.__size = 0
+
+    def close(self):
+        self.flush()
+        self.__queue.put((self, None))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+class Writer(object):
+
+    """ Grava arquivos em um pequeno grupo de threads, para que a
+        consulta ao banco de dados e a renderização não esperem pelo
+        disco (ou por um sistema de arquivos de rede).
+
+        Cada arquivo é gravado por uma única thread, em 'nome.tmp', e
+        renomeado ao ser fechado, de forma que nunca fica incompleto.
+        As filas das threads são limitadas: quem escreve espera quando
+        a gravação está atrasada. close() aguarda todas as gravações e
+        levanta o primeiro erro ocorrido.
+    """
+
+    def __init__(self, threads=THREADS, chunk_size=CHUNK_SIZE,
+                 max_chunks=MAX_CHUNKS):
+        self.chunk_size = chunk_size
+        self.__next = itertools.count()
+        self.__errors = []
+        self.__queues = [Queue.Queue(max_chunks) for i in range(threads)]
+        self.__threads = [threading.Thread(target=self.__run, args=(q,))
+                          for q in self.__queues]
+
+        for thread in self.__threads:
+            thread.daemon = True
+            thread.start()
+
+    def open(self, fname):
+
+        """ Retorna um WriterFile para gravar o arquivo 'fname' """
+
+        queue = self.__queues[next(self.__next) % len(self.__queues)]
+        return WriterFile(fname, queue, self.chunk_size)
+
+    def __run(self, queue):
+        files = {}
+        failed = set()
+
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+
+            f, data = item
+            if f in failed:
+                continue
+
+            try:
+                if f not in files:
+                    files[f] = open(f.fname + ".tmp", "wb")
+
+                if data is None:
+                    files.pop(f).close()
+                    os.rename(f.fname + ".tmp", f.fname)
+                else:
+                    files[f].write(data)
+            except Exception:
+                self.__errors.append(sys.exc_info())
+                failed.add(f)
+                self.__discard(f, files.pop(f, None))
+
+        # Arquivos não fechados: a geração foi interrompida
+        for f, fo in files.items():
+            self.__discard(f, fo)
+
+    def __discard(self, f, fo):
+        try:
+            if fo is not None:
+                fo.close()
+            if os.path.exists(f.fname + ".tmp"):
+                os.remove(f.fname + ".tmp")
+        except (IOError, OSError):
+            pass
+
+    def close(self):
+
+        """ Aguarda a gravação de todos os arquivos """
+
+        for queue in self.__queues:
+            queue.put(None)
+
+        for thread in self.__threads:
+            thread.join()
+
+        if self.__errors:
+            exc_type, exc_value, traceback = self.__errors[0]
+            raise exc_type, exc_value, traceback
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Não esconde a exceção original com um erro de gravação
+            try:
+                self.close()
+            except Exception:
+                pass
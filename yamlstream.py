@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from yaml import (StreamStartEvent, StreamEndEvent, DocumentStartEvent,
+                  DocumentEndEvent, MappingStartEvent, MappingEndEvent,
+                  SequenceStartEvent, SequenceEndEvent, ScalarEvent,
+                  ScalarNode)
+
+# O emissor da libyaml (CSafeDumper) quebra as linhas longas entre aspas
+# de outra forma, o que alteraria os yamls existentes. O emissor em
+# Python ocupa quase todo o tempo; o ganho em relação a safe_dump vem
+# somente de não montar o dicionário do schema.
+from yaml import SafeDumper
+
+# Eventos equivalentes aos gerados por yaml.safe_dump com
+# default_flow_style=False, para manter o mesmo arquivo.
+STR_TAG = u'tag:yaml.org,2002:str'
+NULL_TAG = u'tag:yaml.org,2002:null'
+MAP_TAG = u'tag:yaml.org,2002:map'
+SEQ_TAG = u'tag:yaml.org,2002:seq'
+
+
+class SchemaEvents(object):
+
+    """ Gera os eventos do yaml de um schema, tabela por tabela
+        e coluna por coluna, no formato de Schema.to_dic()
+    """
+
+    def __init__(self, resolver):
+        self.resolve = resolver.resolve
+
+    def scalar(self, value):
+        if value is None:
+            tag, value = NULL_TAG, u'null'
+        else:
+            tag = STR_TAG
+            if isinstance(value, str):
+                value = value.decode('utf-8')
+
+        implicit = (tag == self.resolve(ScalarNode, value, (True, False)),
+                    tag == self.resolve(ScalarNode, value, (False, True)))
+
+        return ScalarEvent(None, tag, implicit, value)
+
+    def mapping_start(self):
+        return MappingStartEvent(None, MAP_TAG, True, flow_style=False)
+
+    def sequence_start(self):
+        return SequenceStartEvent(None, SEQ_TAG, True, flow_style=False)
+
+    def item(self, obj):
+
+        """ Nome e descrição de um schema, relação ou coluna """
+
+        yield self.scalar(u"1. name")
+        yield self.scalar(obj.name)
+        yield self.scalar(u"2. description")
+        yield self.scalar(obj.description)
+
+    def relation(self, rel):
+        yield self.mapping_start()
+
+        for event in self.item(rel):
+            yield event
+
+        yield self.scalar(u"3. columns")
+        yield self.sequence_start()
+        for column in rel.columns():
+            yield self.mapping_start()
+            for event in self.item(column):
+                yield event
+            yield MappingEndEvent()
+        yield SequenceEndEvent()
+
+        yield MappingEndEvent()
+
+    def schema(self, schema):
+        yield StreamStartEvent(encoding='utf-8')
+        yield DocumentStartEvent(explicit=None)
+        yield self.mapping_start()
+
+        for event in self.item(schema):
+            yield event
+
+        for key, relations in ((u"3. tables", schema.tables()),
+                               (u"4. views", schema.views())):
+            yield self.scalar(key)
+            yield self.sequence_start()
+            for rel in relations:
+                for event in self.relation(rel):
+                    yield event
+            yield SequenceEndEvent()
+
+        yield MappingEndEvent()
+        yield DocumentEndEvent(explicit=None)
+        yield StreamEndEvent()
+
+
+def dump_schema(schema, stream):
+
+    """ Escreve em 'stream' o yaml de um objeto Schema, idêntico ao de
+        yaml.safe_dump(schema.to_dic()), mas sem montar o dicionário
+        completo.
+    """
+
+    dumper = SafeDumper(stream, encoding='utf-8', allow_unicode=True,
+                        default_flow_style=False)
+
+    for event in SchemaEvents(dumper).schema(schema):
+        dumper.emit(event)